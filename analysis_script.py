@@ -12,12 +12,22 @@ This script performs:
 5. Statistical reporting
 """
 
+import argparse
+import glob
+import hashlib
+import inspect
+import io
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
-import json
+from json_codec import loads
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -26,11 +36,291 @@ sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (10, 6)
 plt.rcParams['font.size'] = 12
 
+# trialdata phases clean_trial_data analyzes
+ANALYSIS_PHASES = {'TEST'}
+
+TRIALDATA_COLUMNS = ['participant_id', 'trial_index', 'timestamp', 'data']
+
+def phase_prefilter(data, phases):
+    """Mask of raw trialdata strings that mention one of `phases`
+
+    A plain substring scan, much cheaper than decoding. It can keep rows
+    that only mention a phase name elsewhere, never drop one in a phase.
+    """
+    mask = pd.Series(False, index=data.index)
+    for phase in phases:
+        mask |= data.str.contains(phase, regex=False, na=False)
+    return mask
+
+def _decode_trial(text):
+    """Decode one trialdata string, or None if it cannot be parsed"""
+    try:
+        return loads(text)
+    except (TypeError, ValueError):
+        pass
+    try:
+        # rows exported as Python reprs use single quotes
+        return loads(text.replace("'", '"'))
+    except (AttributeError, ValueError):
+        return None
+
+def decode_trial_json(data):
+    """Decode a Series of trialdata JSON strings into a Series of dicts
+
+    The whole column is decoded as one JSON array; if any row is malformed
+    it falls back to decoding row by row, and rows that still fail become
+    None.
+    """
+    values = data.tolist()
+    try:
+        records = loads('[' + ','.join(values) + ']')
+        if len(records) == len(values) and all(type(r) is dict for r in records):
+            return pd.Series(records, index=data.index, dtype=object)
+    except (TypeError, ValueError):
+        pass
+    records = [_decode_trial(value) for value in values]
+    return pd.Series([r if isinstance(r, dict) else None for r in records],
+                     index=data.index, dtype=object)
+
+def parse_trials(trial_df, phases=None):
+    """One typed row per decodable trialdata record, with the CSV's id columns
+
+    With `phases`, rows whose raw text cannot be one of those phases are
+    skipped before decoding, and only records in `phases` are returned.
+    """
+    if phases is not None:
+        trial_df = trial_df[phase_prefilter(trial_df['data'], phases)]
+    records = decode_trial_json(trial_df['data'])
+    valid = records.notna()
+    parsed = pd.DataFrame(records[valid].tolist())
+    rows = trial_df[valid]
+    parsed['participant_id'] = rows['participant_id'].to_numpy()
+    parsed['trial_index'] = rows['trial_index'].to_numpy()
+    parsed['timestamp'] = rows['timestamp'].to_numpy()
+
+    if 'phase' not in parsed.columns:
+        parsed['phase'] = None
+    if phases is not None:
+        parsed = parsed[parsed['phase'].isin(phases)].reset_index(drop=True)
+    parsed['phase'] = parsed['phase'].astype('category')
+    if 'rt' in parsed.columns:
+        parsed['rt'] = pd.to_numeric(parsed['rt'], errors='coerce')
+    if 'correct' in parsed.columns:
+        try:
+            parsed['correct'] = parsed['correct'].astype('boolean')
+        except (TypeError, ValueError):
+            pass
+    return parsed
+
+def partial_performance(test_data):
+    """Per-participant sums and counts of `correct` and `rt` for some TEST rows"""
+    partial = test_data.groupby('participant_id').agg(
+        correct_sum=('correct', 'sum'), correct_n=('correct', 'count'),
+        rt_sum=('rt', 'sum'), rt_n=('rt', 'count'), condition=('condition', 'first'))
+    return partial.astype({'correct_sum': 'int64', 'rt_sum': 'float64'})
+
+def merge_partials(partials):
+    """Combine partial_performance frames, in file order, into one"""
+    return pd.concat(partials).groupby(level=0).agg(
+        {'correct_sum': 'sum', 'correct_n': 'sum', 'rt_sum': 'sum', 'rt_n': 'sum',
+         'condition': 'first'})
+
+def stream_performance(trialdata_file, chunksize):
+    """performance_data for a trialdata.csv read `chunksize` rows at a time
+
+    Only the running per-participant totals are kept between chunks, so
+    memory is bounded by the chunk size and the number of participants,
+    not the size of the file.
+    """
+    totals = None
+    rows = 0
+    for chunk in pd.read_csv(trialdata_file, header=None, names=TRIALDATA_COLUMNS,
+                             chunksize=chunksize):
+        rows += len(chunk)
+        test_data = parse_trials(chunk, ANALYSIS_PHASES)
+        if 'correct' not in test_data.columns or 'rt' not in test_data.columns:
+            continue
+        partial = partial_performance(test_data)
+        totals = partial if totals is None else merge_partials([totals, partial])
+    print(f"Streamed {rows} trial records")
+    if totals is None:
+        return pd.DataFrame(columns=['participant_id', 'correct_count', 'total_questions',
+                                     'accuracy', 'mean_rt', 'condition'])
+
+    return pd.DataFrame({
+        'participant_id': totals.index,
+        'correct_count': totals['correct_sum'].to_numpy(),
+        'total_questions': totals['correct_n'].to_numpy(),
+        'accuracy': (totals['correct_sum'] / totals['correct_n']).to_numpy(),
+        'mean_rt': (totals['rt_sum'] / totals['rt_n']).to_numpy(),
+        'condition': totals['condition'].to_numpy(),
+    })
+
+# Analysis pipeline: stage -> (method, upstream stages), in dependency order.
+# run_pipeline starts a stage once its upstream stages are done, running
+# independent stages in parallel threads.
+STAGES = {
+    'load': ('load_data', []),
+    'trials': ('clean_trial_data', ['load']),
+    'questions': ('clean_question_data', ['load']),
+    'merge': ('merge_all_data', ['trials', 'questions']),
+    'demographics': ('analyze_demographics', ['questions']),
+    'hypotheses': ('test_hypotheses', ['merge']),
+    'figures': ('create_visualizations', ['merge', 'questions']),
+    'report': ('write_summary_report', ['demographics', 'hypotheses']),
+    'export': ('save_cleaned_data', ['merge']),
+}
+
+# pyplot is not thread-safe and GUI backends need the main thread, so these
+# stages always run there
+MAIN_THREAD_STAGES = {'figures'}
+
+# Stages whose outputs are cached between runs:
+# stage -> (input file attributes, output attributes).
+# A stage's cache key includes code_fingerprint of its method, so editing
+# it or a helper it calls invalidates its artifacts and everything
+# downstream of them.
+CACHED_STAGES = {
+    'load': (['trialdata_file', 'questiondata_file'], ['trial_df', 'question_df']),
+    'trials': ([], ['performance_data']),
+    'questions': ([], ['demographics', 'survey_data']),
+    'merge': ([], ['full_data']),
+}
+
+# code in this directory is fingerprinted; installed libraries are not
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _referenced_names(code):
+    """Global and attribute names used by a code object and the code nested in it"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _referenced_names(const)
+    return names
+
+def _is_local(func):
+    try:
+        path = inspect.getsourcefile(func)
+    except TypeError:
+        return False
+    return path is not None and os.path.dirname(os.path.abspath(path)) == SOURCE_DIR
+
+def _constant_text(value):
+    """Stable text for a module constant; sets are sorted, as their order varies by run"""
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value, key=repr))
+    return repr(value)
+
+def code_fingerprint(func):
+    """SHA-256 of func's source and of the local functions and constants it uses
+
+    Follows the names in func's bytecode to functions defined in this
+    directory (module functions, methods of its class, json_codec and so
+    on), recursively, and to plain module constants such as ANALYSIS_PHASES.
+    """
+    digest = hashlib.sha256()
+    pending, seen = [func], set()
+    while pending:
+        func = pending.pop()
+        if func in seen:
+            continue
+        seen.add(func)
+        digest.update(inspect.getsource(func).encode())
+        owner = func.__globals__.get(func.__qualname__.split('.')[0])
+        for name in sorted(_referenced_names(func.__code__)):
+            candidates = [func.__globals__.get(name)]
+            if inspect.isclass(owner):
+                candidates.append(inspect.getattr_static(owner, name, None))
+            for value in candidates:
+                if inspect.isfunction(value) and _is_local(value):
+                    pending.append(value)
+                elif isinstance(value, (str, int, float, tuple, list, dict, set, frozenset)):
+                    digest.update(f"{name}={_constant_text(value)}".encode())
+    return digest.hexdigest()
+
+def downstream(stages):
+    """`stages` plus every stage that depends on one of them"""
+    found = set(stages)
+    for stage, (method, upstream) in STAGES.items():
+        if found.intersection(upstream):
+            found.add(stage)
+    return found
+
+def select_stages(only=None, start=None, skip=()):
+    """(target stages, stages to re-run even if cached) for --only/--from/--skip
+
+    Skipping a stage also skips everything downstream of it.
+    """
+    if only:
+        targets = set(only)
+    elif start:
+        targets = downstream([start])
+    else:
+        targets = set(STAGES)
+    targets -= downstream(skip)
+    forced = targets if only or start else set()
+    return targets, forced
+
+class _StageOutput:
+    """sys.stdout stand-in that buffers each stage thread's prints
+
+    Printing a stage's output in one piece when it finishes keeps parallel
+    stages from interleaving their lines.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def file_fingerprint(path):
+    """Size, mtime and SHA-256 of a file's contents"""
+    status = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return [status.st_size, status.st_mtime_ns, digest.hexdigest()]
+
+def write_artifact(frame, base):
+    """Save a DataFrame as base.parquet, or base.pkl if Parquet can't hold it"""
+    try:
+        frame.to_parquet(base + '.parquet')
+        return base + '.parquet'
+    except (ImportError, TypeError, ValueError):
+        # no pyarrow, or object columns with mixed types
+        if os.path.exists(base + '.parquet'):
+            os.remove(base + '.parquet')
+        frame.to_pickle(base + '.pkl')
+        return base + '.pkl'
+
+def read_artifact(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
 class PsiTurkAnalysis:
-    def __init__(self, trialdata_file, questiondata_file):
-        """Initialize with data file paths"""
+    def __init__(self, trialdata_file, questiondata_file, chunksize=None, cache_dir=None):
+        """Initialize with data file paths
+
+        With `chunksize`, trialdata is streamed that many rows at a time
+        instead of being loaded whole. With `cache_dir`, run_full_analysis
+        reuses the outputs of CACHED_STAGES saved there by earlier runs
+        while their inputs and code are unchanged.
+        """
         self.trialdata_file = trialdata_file
         self.questiondata_file = questiondata_file
+        self.chunksize = chunksize
+        self.cache_dir = cache_dir
+        self._fingerprints = {}
+        self._stage_keys = {}
+        self.stage_results = {}
         self.trial_df = None
         self.question_df = None
         self.demographics = None
@@ -43,10 +333,13 @@ class PsiTurkAnalysis:
         print("LOADING DATA")
         print("="*60)
         
-        # Load trial data
-        self.trial_df = pd.read_csv(self.trialdata_file, header=None,
-                                    names=['participant_id', 'trial_index', 'timestamp', 'data'])
-        print(f"Loaded {len(self.trial_df)} trial records")
+        # Load trial data (streamed later by clean_trial_data in chunked mode)
+        if self.chunksize:
+            print(f"Trial records will be streamed in chunks of {self.chunksize}")
+        else:
+            self.trial_df = pd.read_csv(self.trialdata_file, header=None,
+                                        names=TRIALDATA_COLUMNS)
+            print(f"Loaded {len(self.trial_df)} trial records")
         
         # Load question data
         self.question_df = pd.read_csv(self.questiondata_file, header=None,
@@ -60,33 +353,26 @@ class PsiTurkAnalysis:
         print("CLEANING TRIAL DATA")
         print("="*60)
         
-        # Parse JSON data column
-        parsed_data = []
-        for idx, row in self.trial_df.iterrows():
-            try:
-                data_dict = json.loads(row['data'].replace("'", '"'))
-                data_dict['participant_id'] = row['participant_id']
-                data_dict['trial_index'] = row['trial_index']
-                data_dict['timestamp'] = row['timestamp']
-                parsed_data.append(data_dict)
-            except:
-                continue
-        
-        trial_parsed = pd.DataFrame(parsed_data)
-        
-        # Extract test phase data (actual quiz responses)
-        test_data = trial_parsed[trial_parsed['phase'] == 'TEST'].copy()
-        
-        # Calculate performance metrics
-        self.performance_data = test_data.groupby('participant_id').agg({
-            'correct': ['sum', 'count', 'mean'],
-            'rt': 'mean',
-            'condition': 'first'
-        }).reset_index()
-        
-        self.performance_data.columns = ['participant_id', 'correct_count', 
-                                         'total_questions', 'accuracy', 
-                                         'mean_rt', 'condition']
+        if self.chunksize:
+            # Parse, filter and aggregate one chunk at a time
+            self.performance_data = stream_performance(self.trialdata_file, self.chunksize)
+        else:
+            # Parse JSON data column
+            trial_parsed = parse_trials(self.trial_df, ANALYSIS_PHASES)
+            
+            # Extract test phase data (actual quiz responses)
+            test_data = trial_parsed[trial_parsed['phase'] == 'TEST'].copy()
+            
+            # Calculate performance metrics
+            self.performance_data = test_data.groupby('participant_id').agg({
+                'correct': ['sum', 'count', 'mean'],
+                'rt': 'mean',
+                'condition': 'first'
+            }).reset_index()
+            
+            self.performance_data.columns = ['participant_id', 'correct_count', 
+                                             'total_questions', 'accuracy', 
+                                             'mean_rt', 'condition']
         
         print(f"Processed {len(self.performance_data)} participants")
         print(f"Conditions: {self.performance_data['condition'].value_counts().to_dict()}")
@@ -158,7 +444,7 @@ class PsiTurkAnalysis:
         age_min = self.demographics['age'].min()
         age_max = self.demographics['age'].max()
         
-        print(f"Age Statistics:")
+        print("Age Statistics:")
         print(f"  Mean (SD): {age_mean:.2f} ({age_std:.2f})")
         print(f"  Range: {age_min:.0f} - {age_max:.0f}")
         print()
@@ -436,7 +722,7 @@ class PsiTurkAnalysis:
         
         report.append("DEMOGRAPHICS:")
         report.append(f"  Age: M = {demo_stats['age_mean']:.2f}, SD = {demo_stats['age_std']:.2f}")
-        report.append(f"  Gender Distribution:")
+        report.append("  Gender Distribution:")
         for gender, count in demo_stats['gender_counts'].items():
             report.append(f"    - {gender}: {count}")
         report.append("")
@@ -460,29 +746,202 @@ class PsiTurkAnalysis:
         print(report_text)
         print("Summary report saved to: analysis_output/ANALYSIS_SUMMARY_REPORT.txt")
         
-    def run_full_analysis(self):
-        """Execute complete analysis pipeline"""
-        self.load_data()
-        self.clean_trial_data()
-        self.clean_question_data()
-        self.merge_all_data()
-        
-        demo_stats = self.analyze_demographics()
-        hypothesis_results = self.test_hypotheses()
-        self.create_visualizations()
-        self.generate_summary_report(demo_stats, hypothesis_results)
+    def write_summary_report(self):
+        """generate_summary_report from the demographics and hypotheses stages"""
+        os.makedirs('analysis_output', exist_ok=True)
+        self.generate_summary_report(self.stage_results['demographics'],
+                                     self.stage_results['hypotheses'])
         
-        # Save cleaned data
+    def save_cleaned_data(self):
+        """Save the merged dataset"""
+        os.makedirs('analysis_output', exist_ok=True)
         self.full_data.to_csv('analysis_output/cleaned_full_data.csv', index=False)
         print("\n✓ Cleaned data saved to: analysis_output/cleaned_full_data.csv")
         
+    def stage_key(self, stage):
+        """Cache key of a stage: its code fingerprint, inputs and upstream keys"""
+        if stage not in self._stage_keys:
+            inputs, outputs = CACHED_STAGES[stage]
+            code = code_fingerprint(getattr(type(self), STAGES[stage][0]))
+            for attr in inputs:
+                path = getattr(self, attr)
+                if path not in self._fingerprints:
+                    self._fingerprints[path] = file_fingerprint(path)
+            key = json.dumps([stage, code, bool(self.chunksize),
+                              [self._fingerprints[getattr(self, attr)] for attr in inputs],
+                              [self.stage_key(name) for name in STAGES[stage][1]]])
+            self._stage_keys[stage] = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return self._stage_keys[stage]
+        
+    def _manifest_path(self, stage):
+        return os.path.join(self.cache_dir, f"{stage}-{self.stage_key(stage)}.json")
+        
+    def cache_is_fresh(self, stage):
+        """Whether the cache holds this stage's outputs for the current inputs"""
+        if self.cache_dir is None or stage not in CACHED_STAGES:
+            return False
+        manifest_path = self._manifest_path(stage)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return all(path is None or os.path.exists(path) for path in manifest.values())
+        
+    def restore_stage(self, stage):
+        """Load a stage's outputs from the cache"""
+        manifest_path = self._manifest_path(stage)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for attr, path in manifest.items():
+            setattr(self, attr, None if path is None else read_artifact(path))
+        print(f"Reusing cached {stage} ({manifest_path})")
+        
+    def store_stage(self, stage):
+        """Save a stage's outputs to the cache, replacing its older artifacts"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(self.cache_dir, f"{stage}-*")):
+            os.remove(path)
+        manifest_path = self._manifest_path(stage)
+        base = manifest_path[:-len('.json')]
+        manifest = {attr: None if getattr(self, attr) is None
+                    else write_artifact(getattr(self, attr), f"{base}.{attr}")
+                    for attr in CACHED_STAGES[stage][1]}
+        # written last, so an interrupted store is never reused
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        
+    def plan(self, targets, forced=()):
+        """stage -> 'run' or 'restore' for `targets` and what they need
+
+        Targets with fresh cached outputs are left alone unless forced.
+        Upstream stages are restored from the cache when fresh and run
+        otherwise.
+        """
+        actions = {}
+        
+        def need(stage):
+            if stage in actions:
+                return
+            if stage not in forced and self.cache_is_fresh(stage):
+                actions[stage] = 'restore'
+                return
+            actions[stage] = 'run'
+            for upstream in STAGES[stage][1]:
+                need(upstream)
+        
+        for stage in STAGES:
+            if stage in targets and (stage in forced or not self.cache_is_fresh(stage)):
+                need(stage)
+        return {stage: actions[stage] for stage in STAGES if stage in actions}
+        
+    def _execute(self, stage, action, output=None):
+        """Run or restore one stage; with `output`, print its output in one piece"""
+        if output is not None:
+            output.local.buffer = io.StringIO()
+        try:
+            if action == 'restore':
+                self.restore_stage(stage)
+            else:
+                self.stage_results[stage] = getattr(self, STAGES[stage][0])()
+                if self.cache_dir is not None and stage in CACHED_STAGES:
+                    self.store_stage(stage)
+        finally:
+            if output is not None:
+                text = output.local.buffer.getvalue()
+                del output.local.buffer
+                with output.lock:
+                    output.stream.write(text)
+                    output.stream.flush()
+        
+    def run_pipeline(self, only=None, start=None, skip=(), jobs=None):
+        """Run the requested stages (see select_stages) and what they need
+
+        With jobs > 1 (default: one per CPU, up to 4), independent stages
+        run in parallel threads, except MAIN_THREAD_STAGES.
+        """
+        if jobs is None:
+            jobs = min(4, os.cpu_count() or 1)
+        targets, forced = select_stages(only, start, skip)
+        actions = self.plan(targets, forced)
+        fresh = sorted(targets - set(actions), key=list(STAGES).index)
+        if fresh:
+            print(f"Up to date: {', '.join(fresh)}")
+        
+        if jobs <= 1:
+            for stage, action in actions.items():
+                self._execute(stage, action)
+        else:
+            output = _StageOutput(sys.stdout)
+            sys.stdout = output
+            try:
+                self._run_parallel(actions, jobs, output)
+            finally:
+                sys.stdout = output.stream
+        
         print("\n" + "="*60)
         print("ANALYSIS COMPLETE!")
         print("="*60)
         print("Check 'analysis_output/' folder for all results")
+        
+    def _run_parallel(self, actions, jobs, output):
+        # stage -> upstream stages it is still waiting for; restoring needs none
+        pending = {stage: set(STAGES[stage][1]) if action == 'run' else set()
+                   for stage, action in actions.items()}
+        running = {}
+        
+        def finished(stage):
+            for waiting in pending.values():
+                waiting.discard(stage)
+        
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            while pending or running:
+                ready = [stage for stage, waiting in pending.items() if not waiting]
+                for stage in ready:
+                    if stage not in MAIN_THREAD_STAGES:
+                        del pending[stage]
+                        future = pool.submit(self._execute, stage, actions[stage], output)
+                        running[future] = stage
+                main_ready = [stage for stage in ready if stage in MAIN_THREAD_STAGES]
+                if main_ready:
+                    del pending[main_ready[0]]
+                    self._execute(main_ready[0], actions[main_ready[0]], output)
+                    finished(main_ready[0])
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    finished(running.pop(future))
+        
+    def run_full_analysis(self):
+        """Execute complete analysis pipeline"""
+        self.run_pipeline()
 
 
 # Run the analysis
 if __name__ == "__main__":
-    analyzer = PsiTurkAnalysis('trialdata.csv', 'questiondata.csv')
-    analyzer.run_full_analysis()
+    parser = argparse.ArgumentParser(description="Robot Tutor Adaptiveness Study analysis")
+    parser.add_argument('--trialdata', default='trialdata.csv')
+    parser.add_argument('--questiondata', default='questiondata.csv')
+    parser.add_argument('--chunksize', type=int,
+                        help="stream trialdata.csv this many rows at a time")
+    parser.add_argument('--cache-dir', default='analysis_cache',
+                        help="where cleaned data is cached between runs")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="re-parse everything and leave the cache untouched")
+    stages = parser.add_mutually_exclusive_group()
+    stages.add_argument('--only', nargs='+', choices=list(STAGES), metavar='STAGE',
+                        help=f"run just these stages, plus any stale stages they need "
+                             f"({', '.join(STAGES)})")
+    stages.add_argument('--from', dest='start', choices=list(STAGES), metavar='STAGE',
+                        help="re-run this stage and everything downstream of it")
+    parser.add_argument('--skip', nargs='+', default=[], choices=list(STAGES),
+                        metavar='STAGE', help="don't run these stages or anything downstream")
+    parser.add_argument('--jobs', type=int,
+                        help="stages to run in parallel (default: one per CPU, up to 4; "
+                             "1 runs them one at a time)")
+    options = parser.parse_args()
+    
+    analyzer = PsiTurkAnalysis(options.trialdata, options.questiondata,
+                               chunksize=options.chunksize,
+                               cache_dir=None if options.no_cache else options.cache_dir)
+    analyzer.run_pipeline(options.only, options.start, options.skip, jobs=options.jobs)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Benchmark trialdata.csv parsing in analysis_script.py against the old loop.
+
+Usage: python bench_clean_trial_data.py [--rows N] [--questions N] [--path FILE]
+                                        [--chunksize N]
+
+Writes a synthetic trialdata.csv shaped like psiTurk's export (same
+generator as bench_json_codec.py, some responses contain apostrophes)
+to a temporary file that is deleted afterwards, or to --path, kept,
+then times the old iterrows/replace/json.loads loop against
+analysis_script.parse_trials, with and without the TEST phase pre-scan,
+and compares the per-participant TEST performance they produce. Then
+compares peak memory of building performance_data from the whole file
+against streaming it in --chunksize chunks, each in a fresh process.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import pandas as pd
+
+from analysis_script import (ANALYSIS_PHASES, TRIALDATA_COLUMNS, parse_trials,
+                             stream_performance)
+from bench_json_codec import synthetic_records
+
+def write_synthetic_trialdata(path, rows, questions=40, seed=0):
+    """Write a headerless trialdata.csv with `rows` records, as psiTurk exports it"""
+    rng = random.Random(seed)
+    written = participant = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        while written < rows:
+            uniqueid, records = synthetic_records(participant, questions, rng)
+            for record in records[:rows - written]:
+                writer.writerow([uniqueid, record['current_trial'], record['dateTime'],
+                                 json.dumps(record['trialdata'])])
+            written += min(len(records), rows - written)
+            participant += 1
+    return participant
+
+def legacy_parse_trials(trial_df):
+    """The original clean_trial_data loop"""
+    parsed_data = []
+    for idx, row in trial_df.iterrows():
+        try:
+            data_dict = json.loads(row['data'].replace("'", '"'))
+            data_dict['participant_id'] = row['participant_id']
+            data_dict['trial_index'] = row['trial_index']
+            data_dict['timestamp'] = row['timestamp']
+            parsed_data.append(data_dict)
+        except:
+            continue
+    return pd.DataFrame(parsed_data)
+
+def performance(trial_parsed):
+    """clean_trial_data's per-participant TEST aggregation"""
+    test_data = trial_parsed[trial_parsed['phase'] == 'TEST']
+    result = test_data.groupby('participant_id').agg({
+        'correct': ['sum', 'count', 'mean'],
+        'rt': 'mean',
+        'condition': 'first'
+    }).reset_index()
+    result.columns = ['participant_id', 'correct_count', 'total_questions',
+                      'accuracy', 'mean_rt', 'condition']
+    return result
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def _build_performance(path, chunksize, results):
+    """Child process: performance_data plus elapsed time and peak RSS (MiB)"""
+    start = time.perf_counter()
+    if chunksize:
+        result = stream_performance(path, chunksize)
+    else:
+        trial_df = pd.read_csv(path, header=None, names=TRIALDATA_COLUMNS)
+        result = performance(parse_trials(trial_df, ANALYSIS_PHASES))
+    elapsed = time.perf_counter() - start
+    results.put((result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+def build_in_child(path, chunksize=None):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    child = context.Process(target=_build_performance, args=(path, chunksize, results))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+def run_benchmark(options):
+    """Write the synthetic file to options.path and run every comparison on it"""
+    participants, elapsed = timed(write_synthetic_trialdata, options.path,
+                                  options.rows, options.questions)
+    size = os.path.getsize(options.path) / 2**20
+    print(f"\nWrote {options.rows} rows ({participants} participants, {size:.0f} MiB) "
+          f"to {options.path} in {elapsed:.1f}s")
+
+    print(f"\n{'performance_data':<20} {'time':>9} {'peak RSS':>10}")
+    whole, whole_time, whole_rss = build_in_child(options.path)
+    streamed, streamed_time, streamed_rss = build_in_child(options.path, options.chunksize)
+    print(f"{'whole file':<20} {whole_time:>8.2f}s {whole_rss:>6.0f} MiB")
+    print(f"{'chunks of ' + str(options.chunksize):<20} {streamed_time:>8.2f}s "
+          f"{streamed_rss:>6.0f} MiB")
+    pd.testing.assert_frame_equal(streamed, whole, check_dtype=False)
+
+    trial_df = pd.read_csv(options.path, header=None, names=TRIALDATA_COLUMNS)
+    legacy, legacy_time = timed(legacy_parse_trials, trial_df)
+    parsed, parsed_time = timed(parse_trials, trial_df)
+    filtered, filtered_time = timed(parse_trials, trial_df, ANALYSIS_PHASES)
+
+    print(f"\n{'Parser':<20} {'rows kept':>10} {'time':>9} {'rows/s':>11} {'speedup':>8}")
+    for name, frame, elapsed in [('iterrows loop', legacy, legacy_time),
+                                 ('parse_trials', parsed, parsed_time),
+                                 ('parse_trials (TEST)', filtered, filtered_time)]:
+        print(f"{name:<20} {len(frame):>10} {elapsed:>8.2f}s {len(trial_df) / elapsed:>11.0f} "
+              f"{legacy_time / elapsed:>7.1f}x")
+
+    # the old loop drops every record with an apostrophe; everything else must agree
+    clean = ~trial_df['data'].str.contains("'", regex=False)
+    expected = performance(legacy)
+    actual = performance(parse_trials(trial_df[clean]))
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+    pd.testing.assert_frame_equal(performance(filtered), performance(parsed))
+    print(f"\nPerformance tables match on the {clean.sum()} rows without apostrophes; "
+          f"the old loop dropped {len(trial_df) - len(legacy)} rows that have them.\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--questions', type=int, default=40)
+    parser.add_argument('--path', help="keep the synthetic trialdata.csv here "
+                                        "(default: a temporary file, deleted afterwards)")
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    options = parser.parse_args()
+
+    if options.path:
+        run_benchmark(options)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        options.path = os.path.join(tmp_dir, 'trialdata.csv')
+        run_benchmark(options)
+
+if __name__ == '__main__':
+    main()
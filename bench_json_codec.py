@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark the JSON backends available to json_codec on synthetic datastrings.
+
+Usage: python bench_json_codec.py [--participants N] [--questions N] [--repeat N]
+
+Builds datastrings shaped like the ones task.js saves (instructions,
+condition assignment, TEST/FEEDBACK records per question, events and the
+post-questionnaire) and reports the per-participant decode time of each
+installed backend.
+"""
+
+import argparse
+import json
+import random
+import time
+
+import json_codec
+
+def synthetic_records(participant, questions, rng):
+    """(uniqueid, datastring `data` records) for one synthetic participant"""
+    uniqueid = f"worker{participant}:assignment{participant}"
+    condition = rng.choice(['adaptive', 'static'])
+    timestamp = 1764547153200
+    records = []
+
+    def record(trialdata):
+        nonlocal timestamp
+        timestamp += rng.randint(500, 15000)
+        records.append({"uniqueid": uniqueid, "current_trial": len(records),
+                        "dateTime": timestamp, "trialdata": trialdata})
+
+    for page in range(4):
+        record({"action": "NextPage", "indexOf": page, "phase": "INSTRUCTIONS",
+                "template": f"instructions/instruct-{page + 1}.html",
+                "viewTime": rng.randint(2000, 12000)})
+    record({"condition": condition, "phase": "ASSIGNMENT"})
+    for question in range(questions):
+        correct = rng.random() < 0.6
+        record({"condition": condition, "correct": correct, "correct_answer": "x^2/2",
+                "difficulty": rng.choice(['easy', 'medium', 'hard']), "phase": "TEST",
+                "question_id": f"q{question}",
+                "question_text": "What is the integral of x dx? (Format: x^2/2, omit +C)",
+                "response": ("x^2/2" if correct else
+                             rng.choice([str(rng.randint(0, 999)), "I don't know"])),
+                "rt": rng.randint(800, 30000), "trial_index": question})
+        record({"condition": condition, "phase": "FEEDBACK", "question_id": f"q{question}",
+                "feedback_type": f"{condition}_{'positive' if correct else 'negative'}"})
+    survey = {f"{name}_q{n}": str(rng.randint(1, 5))
+              for name in ('engagement', 'usability', 'adaptiveness') for n in (1, 2)}
+    record({"phase": "postquestionnaire", "survey": json.dumps(survey)})
+    return uniqueid, records
+
+def synthetic_datastring(participant, questions, rng):
+    """One participant's datastring, as psiTurk stores it"""
+    uniqueid, records = synthetic_records(participant, questions, rng)
+    timestamp = records[-1]["dateTime"]
+    events = [{"eventtype": rng.choice(['focus', 'resize']), "value": "on",
+               "timestamp": timestamp - i * 1000, "interval": 0} for i in range(20)]
+    return json.dumps({
+        "condition": 0, "counterbalance": 0, "assignmentId": f"assignment{participant}",
+        "workerId": f"worker{participant}", "hitId": "hit", "currenttrial": len(records),
+        "bonus": 0, "data": records, "eventdata": events,
+        "questiondata": {"age": str(rng.randint(18, 70)), "gender": "prefer not to say",
+                         "general_comments": "It's a nice tutor, \"mostly\" fine."},
+        "useragent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+    })
+
+def bench(loads, datastrings, repeat):
+    """Best total time over `repeat` runs of decoding every datastring"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for datastring in datastrings:
+            loads(datastring)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participants', type=int, default=500)
+    parser.add_argument('--questions', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args()
+
+    rng = random.Random(0)
+    datastrings = [synthetic_datastring(i, options.questions, rng)
+                   for i in range(options.participants)]
+    size = sum(len(d) for d in datastrings) / len(datastrings)
+    expected = [json.loads(d) for d in datastrings]
+
+    print(f"\n{options.participants} participants, {options.questions} questions, "
+          f"{size / 1024:.1f} KiB per datastring")
+    print(f"json_codec backend: {json_codec.BACKEND}\n")
+    print(f"{'Backend':<10} {'per participant':>16} {'total':>10} {'speedup':>8}")
+
+    baseline = None
+    for name, loads in reversed(list(json_codec.BACKENDS.items())):
+        if [loads(d) for d in datastrings] != expected:
+            print(f"{name:<10} decodes differently from json, skipped")
+            continue
+        elapsed = bench(loads, datastrings, options.repeat)
+        baseline = baseline or elapsed
+        per_participant = elapsed / len(datastrings) * 1e6
+        print(f"{name:<10} {per_participant:>13.1f} us {elapsed:>9.3f}s "
+              f"{baseline / elapsed:>7.2f}x")
+    print()
+
+if __name__ == '__main__':
+    main()
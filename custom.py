@@ -3,28 +3,71 @@ from __future__ import generator_stop
 from flask import Blueprint, render_template, request, jsonify, Response, abort, current_app
 from jinja2 import TemplateNotFound
 from functools import wraps
-from sqlalchemy import or_
+from sqlalchemy import or_, func, select, exists, case, event, inspect, Column, Index, Integer, String, Boolean, Float, BigInteger, DateTime
+from sqlalchemy.exc import DatabaseError, IntegrityError
 
 from psiturk.psiturk_config import PsiturkConfig
 from psiturk.experiment_errors import ExperimentError, InvalidUsageError
 from psiturk.user_utils import PsiTurkAuthorization, nocache
+from psiturk.psiturk_exceptions import PsiturkException
+from psiturk.psiturk_statuses import COMPLETED, SUBMITTED, CREDITED, QUITEARLY, BONUSED
 
 # # Database setup
-from psiturk.db import db_session, init_db
-from psiturk.models import Participant
-from json import dumps, loads
+from psiturk.db import db_session, init_db, engine
+from psiturk.models import Base, Participant
+from json import dumps
+from json_codec import loads
+from trial_records import TRIALS_TABLE, SUMMARY_TABLE, BONUS_PER_CORRECT, shred_records
+from sqlite_tuning import DATABASE_PRAGMAS, tune_sqlite_connection
+from db_indexes import ASSIGNMENT_INDEXES, CHANGES_TABLE, CHANGE_LOG_DDL
 
 # load the configuration options
 config = PsiturkConfig()
 config.load_config()
-# if you want to add a password protect route, uncomment and use this
-#myauth = PsiTurkAuthorization(config)
+
+# busy timeout and synchronous for every new connection to participants.db;
+# psiTurk doesn't pool them, so this runs on every request (WAL is set once,
+# in enable_wal)
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def _tune_sqlite(dbapi_connection, connection_record):
+        tune_sqlite_connection(dbapi_connection)
+
+# password protected routes use the dashboard login (login_username, login_pw
+# and secret_key in config.txt); without one they refuse every request
+try:
+    myauth = PsiTurkAuthorization(config)
+except PsiturkException:
+    myauth = None
+
+def requires_auth(func):
+    """myauth.requires_auth, or a 403 while config.txt has no login"""
+    if myauth is not None:
+        return myauth.requires_auth(func)
+    @wraps(func)
+    def refused(*args, **kwargs):
+        current_app.logger.warning("%s needs login_username, login_pw and secret_key "
+                                   "in config.txt", request.path)
+        abort(403)
+    return refused
 
 # explore the Blueprint
 custom_code = Blueprint('custom_code', __name__,
                         template_folder='templates', static_folder='static')
 
 
+@custom_code.before_app_first_request
+def enable_wal():
+    """Switch participants.db to WAL; the mode is stored in the file, so once is enough"""
+    if engine.dialect.name != 'sqlite':
+        return
+    connection = engine.raw_connection()
+    try:
+        tune_sqlite_connection(connection, DATABASE_PRAGMAS)
+    finally:
+        connection.close()
+
+
 ###########################################################
 #  serving warm, fresh, & sweet custom, user-provided routes
 #  add them here
@@ -57,6 +100,97 @@ def preview():
     except TemplateNotFound:
         abort(404)
 
+# ----------------------------------------------
+# condition assignment - shared by /intro and /instructions
+# ----------------------------------------------
+NUM_CONDS = config.getint('Task Parameters', 'num_conds')
+CODE_VERSION = config.get('Task Parameters', 'experiment_code_version')
+
+
+class ConditionCounter(Base):
+    """
+    Arrival counter used to alternate conditions, one row per code version.
+    """
+    __tablename__ = 'condition_counter'
+
+    codeversion = Column(String(128), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class ConditionAssignment(Base):
+    """
+    Condition handed out to a workerId:assignmentId before consent.
+    """
+    __tablename__ = 'condition_assignment'
+
+    uniqueid = Column(String(128), primary_key=True)
+    cond = Column(Integer, nullable=False)
+
+
+def _next_condition():
+    """Atomically bump the counter row and map the new value onto a condition"""
+    counter = ConditionCounter.__table__
+    result = db_session.execute(
+        counter.update().
+        where(counter.c.codeversion == CODE_VERSION).
+        values(value=counter.c.value + 1))
+    if result.rowcount == 0:
+        # first assignment for this code version
+        db_session.execute(counter.insert().values(codeversion=CODE_VERSION, value=1))
+    value = db_session.query(ConditionCounter.value).\
+        filter(ConditionCounter.codeversion == CODE_VERSION).\
+        scalar()
+    return (value - 1) % NUM_CONDS
+
+
+def _record_condition(uniqueId, condition):
+    """Persist uniqueId's condition; IntegrityError if another process already did"""
+    db_session.add(ConditionAssignment(uniqueid=uniqueId, cond=condition))
+    db_session.commit()
+    return condition
+
+
+def _allocate_condition(uniqueId):
+    """Hand out the next condition to uniqueId and persist it"""
+    return _record_condition(uniqueId, _next_condition())
+
+
+def assign_condition(workerId, assignmentId):
+    """Return the sticky condition for workerId:assignmentId, allocating one if needed
+
+    condition_assignment is the only source of truth, read on every call so
+    all server processes agree: participants psiTurk stored a cond for
+    before the table existed have it copied there first.
+    """
+    uniqueId = f"{workerId}:{assignmentId}"
+    assignment = ConditionAssignment.query.get(uniqueId)
+    if assignment:
+        condition = assignment.cond
+    else:
+        participant = Participant.query.filter(Participant.uniqueid == uniqueId).first()
+        try:
+            if participant and participant.cond is not None:
+                condition = _record_condition(uniqueId, participant.cond)
+            else:
+                condition = _allocate_condition(uniqueId)
+        except IntegrityError:
+            # another worker process got here first; use its assignment,
+            # or retry if it only raced us to create the counter row
+            db_session.rollback()
+            assignment = ConditionAssignment.query.get(uniqueId)
+            condition = assignment.cond if assignment else _allocate_condition(uniqueId)
+    return condition
+
+
+def custom_get_condition(mode):
+    """psiTurk's hook for choosing (cond, counterbalance) when /exp creates a participant
+
+    Replaces its get_random_condcount, so the cond stored on the
+    assignments row and passed to task.js is the one /intro and
+    /instructions showed. Counterbalancing isn't used (num_counters = 1).
+    """
+    return assign_condition(request.args['workerId'], request.args['assignmentId']), 0
+
 # ----------------------------------------------
 # intro route - shows experiment intro with screenshot and robot explanation
 # ----------------------------------------------
@@ -79,18 +213,8 @@ def intro():
         import random
         condition = random.randint(0, 1)
     else:
-        # Check if participant already exists
-        uniqueId = f"{workerId}:{assignmentId}"
-        participant = Participant.query.filter(Participant.uniqueid == uniqueId).first()
-        
-        if participant:
-            # Use existing condition
-            condition = participant.cond
-        else:
-            # Assign new condition (simple alternating assignment)
-            # Count existing participants to alternate
-            count = Participant.query.count()
-            condition = count % 2
+        # Existing participants keep their condition, new ones alternate
+        condition = assign_condition(workerId, assignmentId)
     
     # Determine which robot image to show
     robot_image = 'adaptive.jpeg' if condition == 0 else 'static.jpeg'
@@ -123,14 +247,7 @@ def instructions():
         import random
         condition = random.randint(0, 1)
     else:
-        uniqueId = f"{workerId}:{assignmentId}"
-        participant = Participant.query.filter(Participant.uniqueid == uniqueId).first()
-        
-        if participant:
-            condition = participant.cond
-        else:
-            count = Participant.query.count()
-            condition = count % 2
+        condition = assign_condition(workerId, assignmentId)
     
     robot_image = 'adaptive.jpeg' if condition == 0 else 'static.jpeg'
     
@@ -168,11 +285,232 @@ def instructions():
 #    except TemplateNotFound:
 #        abort(404)
 
+# ----------------------------------------------
+# indexes and change log on psiTurk's assignments table
+# ----------------------------------------------
+# Declared on the table, so init_db creates them with a fresh database
+_assignment_indexes = [
+    Index(name, *[Participant.__table__.c[column] for column in columns])
+    for name, columns in ASSIGNMENT_INDEXES
+]
+
+
+@custom_code.before_app_first_request
+def migrate_assignment_indexes():
+    """Add any declared index missing from a database created before it was declared"""
+    existing = {index['name'] for index in inspect(engine).get_indexes(Participant.__tablename__)}
+    for index in _assignment_indexes:
+        if index.name in existing:
+            continue
+        try:
+            index.create(bind=engine)
+            current_app.logger.info("created index %s", index.name)
+        except DatabaseError:
+            # another server process created it first
+            names = {i['name'] for i in inspect(engine).get_indexes(Participant.__tablename__)}
+            if index.name not in names:
+                raise
+
+
+class AssignmentChange(Base):
+    """
+    Sequence number of each participant's latest change, kept by the
+    CHANGE_LOG_DDL triggers; incremental exports use it as their watermark.
+    """
+    __tablename__ = CHANGES_TABLE
+
+    uniqueid = Column(String(128), primary_key=True)
+    change_seq = Column(Integer, nullable=False, index=True)
+    changed_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+
+@custom_code.before_app_first_request
+def create_change_log():
+    """Install the change-log triggers, logging rows written before they existed"""
+    if engine.dialect.name != 'sqlite':
+        # the triggers are SQLite syntax, like participants.db
+        return
+    with engine.begin() as connection:
+        for statement in CHANGE_LOG_DDL:
+            connection.execute(statement)
+
+# ----------------------------------------------
+# normalized trial records, filled in as data is saved
+# ----------------------------------------------
+class TrialRecord(Base):
+    """
+    One record from a participant's datastring `data` list, shredded into
+    indexed columns so queries don't have to decode the JSON blob.
+    """
+    __tablename__ = TRIALS_TABLE
+
+    uniqueid = Column(String(128), primary_key=True)
+    trial_index = Column(Integer, primary_key=True, autoincrement=False)
+    phase = Column(String(64), index=True)
+    question_id = Column(String(64))
+    condition = Column(String(64))
+    correct = Column(Boolean)
+    rt = Column(Float)
+    feedback_type = Column(String(128))
+    timestamp = Column(BigInteger)
+
+
+def _insert_trials(connection, uniqueid, records, start):
+    rows = shred_records(uniqueid, records, start)
+    if rows:
+        connection.execute(TrialRecord.__table__.insert(), rows)
+
+
+@event.listens_for(Participant, 'before_update')
+def _shred_full_sync(mapper, connection, target):
+    """Keep trials in step when a full save (psiTurk's PUT /sync) rewrites the datastring"""
+    if target.__dict__.pop('_trials_shredded', False):
+        # sync_delta already inserted the new records
+        return
+    if not inspect(target).attrs.datastring.history.has_changes() or not target.datastring:
+        return
+    try:
+        parsed = loads(target.datastring)
+    except (TypeError, ValueError):
+        return
+    records = (parsed.get('data') or []) if isinstance(parsed, dict) else None
+    if not isinstance(records, list):
+        # valid JSON but not a psiTurk datastring ("null", a list, ...); nothing to shred
+        return
+
+    trials = TrialRecord.__table__
+    stored = connection.execute(
+        select([func.count()]).select_from(trials).
+        where(trials.c.uniqueid == target.uniqueid)).scalar()
+    if stored > len(records):
+        # the client restarted with fewer records; rebuild from scratch
+        connection.execute(trials.delete().where(trials.c.uniqueid == target.uniqueid))
+        stored = 0
+    _insert_trials(connection, target.uniqueid, records[stored:], stored)
+
+# ----------------------------------------------
+# per-participant summary, kept current as data is saved
+# ----------------------------------------------
+class ParticipantSummary(Base):
+    """
+    The figures `query_data.py stats` reports, one row per participant, so
+    stats is a single aggregate query instead of a scan of every datastring.
+    """
+    __tablename__ = SUMMARY_TABLE
+
+    uniqueid = Column(String(128), primary_key=True)
+    # condition of the last ASSIGNMENT record, None before assignment
+    condition = Column(String(64), index=True)
+    # TEST trials with a question_id, as in the trial data export
+    n_trials = Column(Integer, nullable=False, default=0)
+    n_correct = Column(Integer, nullable=False, default=0)
+    mean_rt = Column(Float)
+    bonus = Column(Float)
+    status = Column(Integer, index=True)
+    completed_at = Column(DateTime)
+
+
+@event.listens_for(Participant, 'after_insert')
+@event.listens_for(Participant, 'after_update')
+def _refresh_summary(mapper, connection, target):
+    """Recompute target's summary row from trials and its assignments row"""
+    trials = TrialRecord.__table__
+    summary = ParticipantSummary.__table__
+    condition = connection.execute(
+        select([func.coalesce(trials.c.condition, 'unknown')]).
+        where(trials.c.uniqueid == target.uniqueid).
+        where(trials.c.phase == 'ASSIGNMENT').
+        order_by(trials.c.trial_index.desc()).
+        limit(1)).scalar()
+    n_trials, n_correct, mean_rt = connection.execute(
+        select([func.count(),
+                func.count(case([(trials.c.correct.is_(True), 1)])),
+                func.avg(trials.c.rt)]).
+        where(trials.c.uniqueid == target.uniqueid).
+        where(trials.c.phase == 'TEST').
+        where(trials.c.question_id.isnot(None))).first()
+
+    values = dict(condition=condition, n_trials=n_trials, n_correct=n_correct,
+                  mean_rt=mean_rt, bonus=target.bonus, status=target.status,
+                  completed_at=target.endhit)
+    result = connection.execute(
+        summary.update().where(summary.c.uniqueid == target.uniqueid).values(**values))
+    if result.rowcount == 0:
+        connection.execute(summary.insert().values(uniqueid=target.uniqueid, **values))
+
+# ----------------------------------------------
+# delta sync - append-only alternative to PUT /sync
+# ----------------------------------------------
+# body keys sync_delta handles itself, never copied from `fields` into the datastring
+DELTA_KEYS = ('data', 'eventdata', 'data_offset', 'event_offset')
+
+
+@custom_code.route('/sync_delta/<uid>', methods=['PUT'])
+def sync_delta(uid=None):
+    """
+    Append the trial and event records a client added since its last save.
+
+    The body carries data_offset/event_offset (how many records the client
+    believes are already stored), the new data/eventdata records, and the
+    remaining model fields. If the offsets don't match what is stored the
+    client gets a 409 and falls back to a full save through /sync.
+
+    Only the request is smaller: the stored datastring is still decoded,
+    extended and re-encoded whole on every save, so server CPU and write
+    size per save grow with the session, and a long session costs
+    quadratic work in total. The TrialRecord rows are appended without
+    touching earlier ones.
+    """
+    delta = request.get_json(silent=True)
+    if not delta or 'data_offset' not in delta or 'event_offset' not in delta:
+        raise InvalidUsageError("delta sync requires data_offset and event_offset")
+    if not isinstance(delta.get('fields', {}), dict):
+        raise InvalidUsageError("delta sync fields must be an object")
+
+    user = Participant.query.filter(Participant.uniqueid == uid).one_or_none()
+    if user is None:
+        raise InvalidUsageError("DB error: Unique user not found.", status_code=404)
+
+    stored = loads(user.datastring) if user.datastring else {}
+    data = stored.setdefault('data', [])
+    eventdata = stored.setdefault('eventdata', [])
+    if len(data) != delta['data_offset'] or len(eventdata) != delta['event_offset']:
+        current_app.logger.info("delta sync for %s out of step, requesting full sync", uid)
+        resp = {"status": "resync", "data_offset": len(data), "event_offset": len(eventdata)}
+        return jsonify(**resp), 409
+
+    new_records = delta.get('data', [])
+    # the records only ever arrive through the offset-checked lists above
+    fields = {key: value for key, value in delta.get('fields', {}).items()
+              if key not in DELTA_KEYS}
+    stored.update(fields)
+    data.extend(new_records)
+    eventdata.extend(delta.get('eventdata', []))
+    user.datastring = dumps(stored)
+    # shred only the appended records, in the same transaction as the datastring
+    _insert_trials(db_session.connection(), uid, new_records, delta['data_offset'])
+    user._trials_shredded = True
+    db_session.add(user)
+    db_session.commit()
+
+    current_app.logger.info("saved delta for %s (current trial: %s)", uid, stored.get('currenttrial'))
+    resp = {"status": "user data saved", "data_offset": len(data), "event_offset": len(eventdata)}
+    return jsonify(**resp)
+
 # ----------------------------------------------
 # example computing bonus
 # ----------------------------------------------
 
 
+def _correct_test_trials(uniqueid):
+    """Count of correct TEST trials for a uniqueid value or correlated column"""
+    trials = TrialRecord.__table__
+    return select([func.count()]).select_from(trials).\
+        where(trials.c.uniqueid == uniqueid).\
+        where(trials.c.phase == 'TEST').\
+        where(trials.c.correct.is_(True))
+
+
 @custom_code.route('/compute_bonus', methods=['GET'])
 def compute_bonus():
     # check that user provided the correct keys
@@ -188,15 +526,17 @@ def compute_bonus():
         user = Participant.query.\
             filter(Participant.uniqueid == uniqueId).\
             one()
-        user_data = loads(user.datastring)  # load datastring from JSON
-        bonus = 0
-
-        for record in user_data['data']:  # for line in data file
-            trial = record['trialdata']
-            if trial['phase'] == 'TEST':
-                if 'correct' in trial and trial['correct'] == True:
-                    bonus += 0.02
-        user.bonus = bonus
+        shredded = db_session.query(TrialRecord.trial_index).\
+            filter(TrialRecord.uniqueid == uniqueId).\
+            first()
+        if shredded is None:
+            # saved before the trials table existed; shred it once now
+            records = loads(user.datastring)['data']
+            _insert_trials(db_session.connection(), uniqueId, records, 0)
+
+        # the trials table is kept current on every save, so this is one indexed count
+        correct = db_session.execute(_correct_test_trials(uniqueId)).scalar()
+        user.bonus = round(correct * BONUS_PER_CORRECT, 2)
         db_session.add(user)
         db_session.commit()
         resp = {"bonusComputed": "success"}
@@ -205,108 +545,330 @@ def compute_bonus():
         abort(404)  # again, bad to display HTML, but...
 
 
+def recompute_bonuses():
+    """
+    Recompute every participant's bonus from the trials table in one UPDATE.
+
+    Participants with no rows in trials (saved before it existed and never
+    backfilled, see `query_data.py backfill-trials`) are left untouched.
+    """
+    participants = Participant.__table__
+    trials = TrialRecord.__table__
+    correct = _correct_test_trials(participants.c.uniqueid).as_scalar()
+    shredded = exists().where(trials.c.uniqueid == participants.c.uniqueid)
+    result = db_session.execute(
+        participants.update().
+        where(shredded).
+        values(bonus=func.round(correct * BONUS_PER_CORRECT, 2)))
+    # a bulk UPDATE bypasses the _refresh_summary listener
+    summary = ParticipantSummary.__table__
+    db_session.execute(
+        summary.update().
+        values(bonus=select([participants.c.bonus]).
+               where(participants.c.uniqueid == summary.c.uniqueid).
+               as_scalar()))
+    db_session.commit()
+    return result.rowcount
+
+
+@custom_code.route('/recompute_bonuses', methods=['POST'])
+@requires_auth
+def recompute_bonuses_route():
+    """Batch mode for /compute_bonus, e.g. after a scoring fix (password protected)"""
+    updated = recompute_bonuses()
+    current_app.logger.info("recomputed bonuses for %s participants", updated)
+    resp = {"bonusComputed": "success", "participants": updated}
+    return jsonify(**resp)
+
+
 # ----------------------------------------------
 # export data to CSV (separate trial data from questionnaire)
 # ----------------------------------------------
 import csv
-from io import StringIO
+import math
+import tempfile
+from flask import stream_with_context
 
-@custom_code.route('/export_data')
-def export_data():
-    """Export trial data and questionnaire data as separate CSV files"""
-    participants = Participant.query.all()
-    
-    # Create trial data CSV
-    trial_output = StringIO()
-    trial_writer = csv.writer(trial_output)
-    trial_writer.writerow(['participant_id', 'condition', 'trial_index', 'question_id', 
-                          'question_text', 'correct_answer', 'response', 'correct', 
-                          'difficulty', 'rt', 'timestamp'])
-    
-    # Create questionnaire data CSV
-    quest_output = StringIO()
-    quest_writer = csv.writer(quest_output)
-    quest_writer.writerow(['participant_id', 'condition', 'age', 'gender', 'psiturk_exp', 
-                          'robot_exp', 'engagement_q1', 'engagement_q2', 'usability_q1', 
-                          'usability_q2', 'adaptiveness_q1', 'adaptiveness_q2', 
-                          'satisfaction_overall', 'general_comments'])
-    
-    for participant in participants:
-        try:
-            user_data = loads(participant.datastring)
-            participant_id = participant.uniqueid
-            condition = None
-            demographics = {}
-            questionnaire = {}
-            
-            # Parse data
-            for record in user_data.get('data', []):
-                trial = record.get('trialdata', {})
-                phase = trial.get('phase', '')
-                
-                # Get condition assignment
-                if phase == 'ASSIGNMENT':
-                    condition = trial.get('condition', 'unknown')
-                
-                # Get trial data
-                elif phase == 'TEST' and 'question_id' in trial:
-                    trial_writer.writerow([
-                        participant_id,
-                        condition or 'unknown',
-                        trial.get('trial_index', ''),
-                        trial.get('question_id', ''),
-                        trial.get('question_text', ''),
-                        trial.get('correct_answer', ''),
-                        trial.get('response', ''),
-                        trial.get('correct', ''),
-                        trial.get('difficulty', ''),
-                        trial.get('rt', ''),
-                        record.get('dateTime', '')
-                    ])
-            
-            # Get demographics from questiondata
-            for item in user_data.get('questiondata', {}).items():
-                key, value = item
-                demographics[key] = value
-            
-            # Get questionnaire from eventdata (if stored there) or questiondata
-            for record in user_data.get('data', []):
-                trial = record.get('trialdata', {})
-                if trial.get('phase') == 'postquestionnaire':
-                    survey_str = trial.get('survey', '{}')
-                    try:
-                        questionnaire = loads(survey_str)
-                    except:
-                        pass
-            
-            # Write questionnaire row
-            quest_writer.writerow([
+TRIAL_COLUMNS = ['participant_id', 'condition', 'trial_index', 'question_id',
+                 'question_text', 'correct_answer', 'response', 'correct',
+                 'difficulty', 'rt', 'timestamp']
+QUESTIONNAIRE_COLUMNS = ['participant_id', 'condition', 'age', 'gender', 'psiturk_exp',
+                         'robot_exp', 'engagement_q1', 'engagement_q2', 'usability_q1',
+                         'usability_q2', 'adaptiveness_q1', 'adaptiveness_q2',
+                         'satisfaction_overall', 'general_comments']
+
+# participants fetched per round trip while streaming an export
+EXPORT_BATCH_SIZE = 100
+# incremental exports include participants once they reach one of these
+FINISHED_STATUSES = (COMPLETED, SUBMITTED, CREDITED, QUITEARLY, BONUSED)
+# questionnaire rows are held in memory up to this size, then spill to disk
+EXPORT_SPOOL_SIZE = 1024 * 1024
+
+
+class _RowEcho:
+    """File-like target that hands back whatever csv.writer writes to it"""
+
+    def write(self, line):
+        return line
+
+
+def _parse_participant(participant_id, datastring):
+    """Decode one datastring into (trial rows, questionnaire row); missing values are None"""
+    user_data = loads(datastring)
+    condition = None
+    trial_rows = []
+    questionnaire = {}
+
+    for record in user_data.get('data', []):
+        trial = record.get('trialdata', {})
+        phase = trial.get('phase', '')
+
+        # Get condition assignment
+        if phase == 'ASSIGNMENT':
+            condition = trial.get('condition', 'unknown')
+
+        # Get trial data
+        elif phase == 'TEST' and 'question_id' in trial:
+            trial_rows.append([
                 participant_id,
                 condition or 'unknown',
-                demographics.get('age', ''),
-                demographics.get('gender', ''),
-                demographics.get('psiturk_exp', ''),
-                demographics.get('robot_exp', ''),
-                questionnaire.get('engagement_q1', ''),
-                questionnaire.get('engagement_q2', ''),
-                questionnaire.get('usability_q1', ''),
-                questionnaire.get('usability_q2', ''),
-                questionnaire.get('adaptiveness_q1', ''),
-                questionnaire.get('adaptiveness_q2', ''),
-                questionnaire.get('satisfaction_overall', ''),
-                demographics.get('general_comments', '')
+                trial.get('trial_index'),
+                trial.get('question_id'),
+                trial.get('question_text'),
+                trial.get('correct_answer'),
+                trial.get('response'),
+                trial.get('correct'),
+                trial.get('difficulty'),
+                trial.get('rt'),
+                record.get('dateTime')
             ])
-            
-        except Exception as e:
-            current_app.logger.error(f"Error processing participant {participant.uniqueid}: {str(e)}")
-            continue
-    
-    # Return both CSVs as a downloadable response
-    response_text = "=== TRIAL DATA ===\n\n" + trial_output.getvalue()
-    response_text += "\n\n=== QUESTIONNAIRE DATA ===\n\n" + quest_output.getvalue()
-    
+
+        # Get questionnaire from the postquestionnaire survey record
+        elif phase == 'postquestionnaire':
+            try:
+                questionnaire = loads(trial.get('survey', '{}'))
+            except (TypeError, ValueError):
+                pass
+
+    # Demographics live in questiondata
+    demographics = user_data.get('questiondata', {})
+
+    quest_row = [
+        participant_id,
+        condition or 'unknown',
+        demographics.get('age'),
+        demographics.get('gender'),
+        demographics.get('psiturk_exp'),
+        demographics.get('robot_exp'),
+        questionnaire.get('engagement_q1'),
+        questionnaire.get('engagement_q2'),
+        questionnaire.get('usability_q1'),
+        questionnaire.get('usability_q2'),
+        questionnaire.get('adaptiveness_q1'),
+        questionnaire.get('adaptiveness_q2'),
+        questionnaire.get('satisfaction_overall'),
+        demographics.get('general_comments')
+    ]
+    return trial_rows, quest_row
+
+
+def _stream_export(query):
+    """Yield the trial section as it is produced, then the spooled questionnaire section"""
+    line = csv.writer(_RowEcho())
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE, mode='w+', newline='') as quest_output:
+        quest_writer = csv.writer(quest_output)
+        quest_writer.writerow(QUESTIONNAIRE_COLUMNS)
+
+        yield "=== TRIAL DATA ===\n\n" + line.writerow(TRIAL_COLUMNS)
+
+        # Server-side cursor: only EXPORT_BATCH_SIZE datastrings are loaded at a time
+        participants = query.yield_per(EXPORT_BATCH_SIZE)
+        for participant_id, datastring in participants:
+            if not datastring:
+                continue
+            try:
+                trial_rows, quest_row = _parse_participant(participant_id, datastring)
+            except Exception as e:
+                current_app.logger.error(f"Error processing participant {participant_id}: {str(e)}")
+                continue
+            if trial_rows:
+                yield "".join(line.writerow(row) for row in trial_rows)
+            quest_writer.writerow(quest_row)
+
+        yield "\n\n=== QUESTIONNAIRE DATA ===\n\n"
+        quest_output.seek(0)
+        for chunk in iter(lambda: quest_output.read(64 * 1024), ''):
+            yield chunk
+
+
+@custom_code.route('/export_data')
+def export_data():
+    """
+    Export trial data and questionnaire data as separate CSV sections, streamed.
+
+    Pass ?since=<X-Export-Watermark from the previous call> to only export
+    finished participants (completed, submitted, credited, bonused or quit
+    early) whose record changed after that point, in change order; ?since=
+    with no value starts an incremental sync from the beginning. A
+    participant who changes again after being exported, e.g. when their
+    bonus is recomputed, is sent again by the next sync.
+    """
+    query = db_session.query(Participant.uniqueid, Participant.datastring)
+    headers = {"Content-disposition": "attachment; filename=experiment_data.txt"}
+
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since or 0)
+        except ValueError:
+            raise InvalidUsageError(f"since must be a previous X-Export-Watermark, got {since}")
+        change_seq = AssignmentChange.change_seq
+        query = query.join(AssignmentChange, AssignmentChange.uniqueid == Participant.uniqueid).\
+            filter(Participant.status.in_(FINISHED_STATUSES), change_seq > since)
+        # Pin the upper bound now so rows changing mid-stream wait for the next sync
+        watermark = query.with_entities(func.max(change_seq)).scalar()
+        if watermark is None:
+            watermark = since
+        else:
+            query = query.filter(change_seq <= watermark).order_by(change_seq)
+        headers["X-Export-Watermark"] = str(watermark)
+
     return Response(
-        response_text,
+        stream_with_context(_stream_export(query)),
         mimetype="text/plain",
-        headers={"Content-disposition": "attachment; filename=experiment_data.txt"})
+        headers=headers)
+
+
+# ----------------------------------------------
+# paginated per-table export with keyset cursor
+# ----------------------------------------------
+EVENT_COLUMNS = ['participant_id', 'eventtype', 'value', 'interval', 'timestamp']
+
+# participants per page unless ?limit= says otherwise
+EXPORT_PAGE_SIZE = 500
+EXPORT_MAX_PAGE_SIZE = 5000
+
+
+def _trial_rows(participant_id, datastring):
+    return _parse_participant(participant_id, datastring)[0]
+
+
+def _questionnaire_rows(participant_id, datastring):
+    return [_parse_participant(participant_id, datastring)[1]]
+
+
+def _event_rows(participant_id, datastring):
+    user_data = loads(datastring)
+    return [[participant_id,
+             event.get('eventtype'),
+             event.get('value'),
+             event.get('interval'),
+             event.get('timestamp')]
+            for event in user_data.get('eventdata', [])]
+
+
+def _as_number(value):
+    """int or float for a numeric field stored as a number or a string; None if it isn't one"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+# columns NDJSON writes as numbers; form fields and survey ratings arrive as strings
+NUMERIC_COLUMNS = {'trial_index', 'rt', 'timestamp', 'interval', 'age'} | \
+    set(QUESTIONNAIRE_COLUMNS[6:-1])
+
+
+# table name -> (columns, row builder)
+EXPORT_TABLES = {
+    'trials': (TRIAL_COLUMNS, _trial_rows),
+    'questionnaire': (QUESTIONNAIRE_COLUMNS, _questionnaire_rows),
+    'events': (EVENT_COLUMNS, _event_rows),
+}
 
+
+def _stream_export_page(participants, columns, build_rows, fmt):
+    """Yield one page of an export as CSV or NDJSON, one participant at a time"""
+    if fmt == 'csv':
+        line = csv.writer(_RowEcho())
+        encode = line.writerow
+        yield encode(columns)
+    else:
+        # typed values: missing fields are null, numeric columns are numbers
+        def encode(row):
+            return dumps({column: _as_number(value) if column in NUMERIC_COLUMNS and value is not None
+                          else value
+                          for column, value in zip(columns, row)}) + "\n"
+
+    for participant_id, datastring in participants:
+        if not datastring:
+            continue
+        try:
+            rows = build_rows(participant_id, datastring)
+        except Exception as e:
+            current_app.logger.error(f"Error processing participant {participant_id}: {str(e)}")
+            continue
+        if rows:
+            yield "".join(encode(row) for row in rows)
+
+
+@custom_code.route('/export/<table>')
+@requires_auth
+def export_table(table):
+    """
+    Export one table a page of participants at a time (password protected).
+
+    Query parameters:
+        after   uniqueid of the last participant from the previous page
+        limit   participants per page (default EXPORT_PAGE_SIZE)
+        format  csv (default) or ndjson
+
+    The X-Next-Cursor response header holds the value to pass as ?after= to
+    fetch the next page; it is absent on the last page. Pages are keyed on
+    uniqueid, so a failed page can be retried with the same cursor.
+    """
+    if table not in EXPORT_TABLES:
+        abort(404)
+    columns, build_rows = EXPORT_TABLES[table]
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        raise InvalidUsageError(f"Unknown export format: {fmt}")
+    try:
+        limit = int(request.args.get('limit', EXPORT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidUsageError("limit must be an integer")
+    if not 0 < limit <= EXPORT_MAX_PAGE_SIZE:
+        raise InvalidUsageError(f"limit must be between 1 and {EXPORT_MAX_PAGE_SIZE}")
+
+    # Keyset pagination on the primary key: no OFFSET scan, stable under inserts
+    query = db_session.query(Participant.uniqueid, Participant.datastring)
+    after = request.args.get('after')
+    if after:
+        query = query.filter(Participant.uniqueid > after)
+    # Cheap key-only pass to find where this page ends before loading datastrings
+    keys = [uniqueid for uniqueid, in query.with_entities(Participant.uniqueid).
+            order_by(Participant.uniqueid).limit(limit)]
+
+    headers = {"Content-disposition": f"attachment; filename={table}.{fmt}"}
+    if len(keys) == limit:
+        headers["X-Next-Cursor"] = keys[-1]
+    if keys:
+        participants = query.filter(Participant.uniqueid <= keys[-1]).\
+            order_by(Participant.uniqueid).\
+            yield_per(EXPORT_BATCH_SIZE)
+    else:
+        participants = []
+
+    return Response(
+        stream_with_context(_stream_export_page(participants, columns, build_rows, fmt)),
+        mimetype="text/csv" if fmt == 'csv' else "application/x-ndjson",
+        headers=headers)
@@ -0,0 +1,58 @@
+"""
+Indexes and the change log on psiTurk's `assignments` table.
+
+psiTurk only indexes the primary key. These cover the columns our routes
+and query_data.py filter and sort on. They are shared by the experiment
+server (custom.py), which declares them on the Participant table and adds
+any that are missing on first request, and by `query_data.py migrate`,
+which does the same offline and verifies them.
+
+psiTurk doesn't record when a row last changed (endhit is only set on
+completion; quitting early or a bonus recompute leave it alone), so
+triggers keep a change log that incremental exports use as their
+watermark.
+"""
+
+ASSIGNMENTS_TABLE = 'assignments'
+
+# (index name, columns), named the way SQLAlchemy names index=True columns
+ASSIGNMENT_INDEXES = [
+    ('ix_assignments_status', ['status']),
+    ('ix_assignments_mode', ['mode']),
+    ('ix_assignments_beginhit', ['beginhit']),
+    ('ix_assignments_endhit', ['endhit']),
+    ('ix_assignments_codeversion', ['codeversion']),
+    ('ix_assignments_workerid_assignmentid', ['workerid', 'assignmentid']),
+]
+
+# One row per participant: change_seq of its latest insert or update.
+# Writes to SQLite are serialized, so change_seq only ever grows in commit order.
+CHANGES_TABLE = 'assignment_changes'
+
+# columns the exports read; rewriting a row with the same values isn't a change
+CHANGE_COLUMNS = ['status', 'bonus', 'beginhit', 'endhit', 'browser', 'platform', 'datastring']
+
+_LOG_CHANGE = f"""
+    INSERT OR REPLACE INTO {CHANGES_TABLE} (uniqueid, change_seq, changed_at)
+    VALUES (NEW.uniqueid,
+            (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM {CHANGES_TABLE}),
+            CURRENT_TIMESTAMP);"""
+
+# SQLite statements creating the change log; each is idempotent
+CHANGE_LOG_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+        uniqueid VARCHAR(128) NOT NULL PRIMARY KEY,
+        change_seq INTEGER NOT NULL,
+        changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)""",
+    f"CREATE INDEX IF NOT EXISTS ix_{CHANGES_TABLE}_change_seq ON {CHANGES_TABLE} (change_seq)",
+    # rows written before the triggers existed count as changed now
+    f"""INSERT OR IGNORE INTO {CHANGES_TABLE} (uniqueid, change_seq)
+        SELECT uniqueid, rowid + (SELECT COALESCE(MAX(change_seq), 0) FROM {CHANGES_TABLE})
+        FROM {ASSIGNMENTS_TABLE}""",
+    f"""CREATE TRIGGER IF NOT EXISTS {ASSIGNMENTS_TABLE}_log_insert
+        AFTER INSERT ON {ASSIGNMENTS_TABLE} BEGIN {_LOG_CHANGE} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {ASSIGNMENTS_TABLE}_log_update
+        AFTER UPDATE ON {ASSIGNMENTS_TABLE}
+        WHEN {' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in CHANGE_COLUMNS)}
+        BEGIN {_LOG_CHANGE} END""",
+]
@@ -0,0 +1,39 @@
+"""
+JSON decoding for datastrings and survey payloads.
+
+Uses orjson when installed, then ujson, and falls back to the standard
+library json module. Shared by the experiment server (custom.py),
+query_data.py and analysis_script.py so every datastring parse goes
+through the same, fastest available, backend.
+
+Set JSON_BACKEND=json (or ujson/orjson) in the environment to force one.
+All backends raise a ValueError subclass on malformed input, like
+json.loads. orjson and ujson reject the NaN/Infinity literals the stdlib
+accepts; browsers' JSON.stringify never writes them.
+"""
+
+import json
+import os
+
+# backend name -> loads, in order of preference
+BACKENDS = {}
+
+try:
+    import orjson
+    BACKENDS['orjson'] = orjson.loads
+except ImportError:
+    pass
+
+try:
+    import ujson
+    BACKENDS['ujson'] = ujson.loads
+except ImportError:
+    pass
+
+BACKENDS['json'] = json.loads
+
+BACKEND = os.environ.get('JSON_BACKEND')
+if BACKEND not in BACKENDS:
+    BACKEND = next(iter(BACKENDS))
+
+loads = BACKENDS[BACKEND]
@@ -5,34 +5,371 @@ Usage: python query_data.py [command]
 
 Commands:
   list          - List all participants
+  query [filters] - List participants matching filters, evaluated in SQL
+                  --condition adaptive|static   --status completed,submitted|3,4
+                  --mode debug|sandbox|live     --codeversion VERSION
+                  --since DATE  --until DATE    started on/after, before (a bare date includes that day)
+                  --phase PHASE                 has at least one record in that phase
+                  --min-accuracy F  --max-accuracy F   TEST accuracy between 0 and 1
+                  --ndjson  print the matching participants' full data as NDJSON instead
   export-csv    - Export to separate CSV files (trial + questionnaire)
+                  --incremental  only append finished participants changed since the last run
+  export-parquet - Export typed, compressed Parquet files (trials, questionnaire, demographics)
+                  --incremental  add a part file with finished participants changed since the last run
   export-json   - Export all data to JSON
+                  --ndjson  one compact JSON object per line instead of an indented array
+                  --compress gzip|zstd  compress the output as it is written
   participant <id> - Show detailed data for specific participant
   stats         - Show summary statistics
+  backfill-trials - Fill the trials table for participants saved before it existed
+  summary-refresh - Rebuild participant_summary (used by stats) from the trials table
+                  --incremental  only participants missing or whose status/bonus/endhit changed
+  migrate       - Create missing indexes and the change log on the assignments table, and verify them
+  explain [sql] - Show SQLite's query plan for the queries these commands run (or for sql)
+  bonus-recompute - Recompute every participant's bonus from their datastring
+                  --workers N  decode in N processes (default: one per CPU)
+  snapshot      - Copy the live database to snapshots/ with SQLite's online backup
+
+Options for list, query, stats, export-csv, export-parquet, export-json, participant and explain:
+  --snapshot [path]  read from a snapshot (default: the latest) instead of the live DB
+
+Options for query --ndjson, stats, export-csv, export-parquet, export-json and participant:
+  --workers N  decode datastrings in N processes (default: in this process)
+
+Options for query --ndjson and export-json:
+  --no-cache   don't read or update the encoded-JSON cache (parse_cache.db)
 """
 
+import argparse
+import collections
+import hashlib
+import os
+import pickle
 import sqlite3
 import json
 import csv
+import functools
+import gzip
+import io
+import itertools
 import sys
-from datetime import datetime
+import textwrap
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from json_codec import loads
+from sqlite_tuning import (DATABASE_PRAGMAS, CONNECTION_PRAGMAS, ANALYSIS_PRAGMAS,
+                           tune_sqlite_connection)
+from db_indexes import ASSIGNMENTS_TABLE, ASSIGNMENT_INDEXES, CHANGES_TABLE, CHANGE_LOG_DDL
+from trial_records import (TRIALS_TABLE, SUMMARY_TABLE, TRIAL_RECORD_COLUMNS, shred_records,
+                           bonus_for_records)
 
 DB_PATH = 'participants.db'
+# Read-only copies made by `snapshot`; read commands use one when --snapshot is given
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_PATH = None
+# Pages copied per backup step; the live DB is only locked while a step runs
+SNAPSHOT_PAGES_PER_STEP = 1024
+# Columns of psiTurk's assignments table. Commands select the subset they
+# need by name; datastring is by far the largest, so only fetch it when used.
+PARTICIPANT_COLUMNS = ['uniqueid', 'assignmentid', 'workerid', 'hitid', 'ipaddress', 'browser',
+                       'platform', 'language', 'cond', 'counterbalance', 'codeversion', 'beginhit',
+                       'beginexp', 'endhit', 'bonus', 'status', 'datastring', 'mode']
+LIST_COLUMNS = ['uniqueid', 'beginhit', 'status', 'mode', 'codeversion', 'endhit']
+EXPORT_COLUMNS = ['uniqueid', 'browser', 'platform', 'beginhit', 'endhit', 'bonus', 'datastring']
+# psiturk_statuses: COMPLETED, SUBMITTED, CREDITED, BONUSED
+COMPLETED_STATUSES = (3, 4, 5, 7)
+# ...and QUITEARLY: participants incremental exports include
+FINISHED_STATUSES = (3, 4, 5, 6, 7)
+# psiturk_statuses by name, for `query --status`
+STATUS_CODES = {'not_accepted': 0, 'allocated': 1, 'started': 2, 'completed': 3,
+                'submitted': 4, 'credited': 5, 'quitearly': 6, 'bonused': 7}
+# Rows handed to the process pool at a time by --workers and bonus-recompute
+DECODE_BATCH_SIZE = 1000
+# Encoded JSON kept between export-json/query --ndjson runs, keyed by
+# uniqueid and a hash of their input. Decoding alone is cheap next to
+# reading the cache back, so CSV, Parquet and stats don't use it.
+PARSE_CACHE_PATH = 'parse_cache.db'
+# Least recently used entries are dropped once the (compressed) cache grows past this
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Bump when the export-json layout or the stored format changes
+PARSE_CACHE_VERSION = 2
+# zlib level for stored values: JSON text shrinks several times even at 1
+PARSE_CACHE_COMPRESSION = 1
+# Queries whose plans `explain` shows
+LIST_QUERY = f"SELECT {', '.join(LIST_COLUMNS)} FROM assignments ORDER BY beginhit DESC"
+PARTICIPANT_QUERY = f"SELECT {', '.join(PARTICIPANT_COLUMNS)} FROM assignments WHERE uniqueid = ?"
+# Rows changed after one change_seq, up to and including another, in change order
+INCREMENTAL_EXPORT_QUERY = f"""
+    SELECT {', '.join('a.' + column for column in EXPORT_COLUMNS)}, c.change_seq
+    FROM {CHANGES_TABLE} c JOIN assignments a ON a.uniqueid = c.uniqueid
+    WHERE c.change_seq > ? AND c.change_seq <= ? AND a.datastring IS NOT NULL
+      AND a.status IN ({', '.join(str(status) for status in FINISHED_STATUSES)})
+    ORDER BY c.change_seq
+"""
+SUMMARY_STATS_QUERY = f"""
+    SELECT condition,
+           COUNT(*) AS participants,
+           COUNT(CASE WHEN status IN ({', '.join('?' * len(COMPLETED_STATUSES))}) THEN 1 END) AS completed,
+           SUM(n_trials) AS trials,
+           SUM(n_correct) AS correct,
+           (SELECT COUNT(*) FROM assignments) AS assignments
+    FROM {SUMMARY_TABLE}
+    GROUP BY condition
+"""
+# Where `export-csv --incremental` remembers how far it got
+WATERMARK_FILE = 'export_watermark.json'
+
+def _read_watermarks():
+    if not os.path.exists(WATERMARK_FILE):
+        return {}
+    with open(WATERMARK_FILE) as f:
+        watermarks = json.load(f)
+    if 'endhit' in watermarks:
+        # written before parquet exports had their own watermark
+        watermarks = {'csv': watermarks}
+    return watermarks
+
+def _watermark_entry(kind):
+    watermark = _read_watermarks().get(kind, {})
+    if 'endhit' in watermark:
+        raise SystemExit(
+            f"{WATERMARK_FILE} holds an endhit watermark from before exports tracked changes.\n"
+            f"Move it and the files the incremental {kind} export appended to aside, then run "
+            f"again to start a new incremental export.")
+    return watermark
+
+def load_watermark(kind):
+    """Return the change_seq the last incremental `kind` export got up to, or 0"""
+    return _watermark_entry(kind).get('change_seq', 0)
+
+def recorded_sizes(kind):
+    """Output file sizes saved with the `kind` watermark
+    
+    {} before the first run, so leftovers are started over; None for a
+    watermark saved without sizes, whose files are left alone.
+    """
+    watermark = _watermark_entry(kind)
+    return watermark.get('sizes', None if 'change_seq' in watermark else {})
+
+def save_watermark(kind, change_seq, sizes=None):
+    """Record the change_seq the next incremental `kind` export should start after
+    
+    Saved last, once the run's output is on disk: a run that dies before
+    this leaves the previous watermark, and is redone from there.
+    """
+    watermarks = _read_watermarks()
+    watermarks[kind] = {'change_seq': change_seq, 'updated': datetime.now().isoformat()}
+    if sizes is not None:
+        watermarks[kind]['sizes'] = sizes
+    tmp_path = WATERMARK_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(watermarks, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, WATERMARK_FILE)
 
 def get_connection():
-    """Get database connection"""
-    return sqlite3.connect(DB_PATH)
+    """Get database connection (WAL mode, so reads don't stall a live server)
+    
+    When SNAPSHOT_PATH is set the snapshot is opened read-only instead.
+    """
+    if SNAPSHOT_PATH:
+        conn = sqlite3.connect(f"file:{SNAPSHOT_PATH}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        tune_sqlite_connection(conn, DATABASE_PRAGMAS + CONNECTION_PRAGMAS + ANALYSIS_PRAGMAS)
+    # rows are read by column name, e.g. row['datastring']
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def select_columns(columns):
+    """SELECT list for the given assignments columns"""
+    return ', '.join(columns)
+
+def table_exists(cursor, name):
+    """Whether the server has created table `name` yet"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def map_rows(func, rows, workers=None):
+    """Yield func(row) for each row, in order, using `workers` processes
+    
+    Without workers everything runs in this process. Otherwise rows are
+    read in DECODE_BATCH_SIZE batches and the next batch is decoding while
+    the results of the previous one are consumed. Rows and results cross
+    process boundaries, so they must be picklable (plain tuples, not
+    sqlite3.Row).
+    """
+    if not workers:
+        yield from map(func, rows)
+        return
+    rows = iter(rows)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = None
+        for batch in iter(lambda: list(itertools.islice(rows, DECODE_BATCH_SIZE)), []):
+            chunksize = max(1, len(batch) // (4 * workers))
+            results = pool.map(func, batch, chunksize=chunksize)
+            if pending is not None:
+                yield from pending
+            pending = results
+        if pending is not None:
+            yield from pending
+
+def _unless_cached(func, job):
+    return None if job is None else func(job)
+
+def map_cached(func, kind, items, job=None, workers=None, cache=None):
+    """Yield (item, value, error) for each item, in order, reusing cached values
+    
+    func is applied to job(item) (the item itself by default), a tuple
+    starting with the uniqueid. Like map_rows, but a job whose `kind`
+    result is in cache for the same uniqueid and job contents is not
+    recomputed; only misses are sent to func. func returns (value, error)
+    and only values without an error are stored.
+    """
+    job = job or (lambda item: item)
+    pending = collections.deque()
+    
+    def misses():
+        for item in items:
+            args = job(item)
+            cached = cache.get(kind, args) if cache else None
+            pending.append((item, args, cached))
+            yield args if cached is None else None
+    
+    for result in map_rows(functools.partial(_unless_cached, func), misses(), workers):
+        item, args, cached = pending.popleft()
+        if cached is not None:
+            yield item, cached, None
+            continue
+        value, error = result
+        if cache and error is None:
+            cache.put(kind, args, value)
+        yield item, value, error
+
+class ParseCache:
+    """Parse results stored in a side SQLite file between runs
+    
+    Entries are keyed by (kind, uniqueid) and carry a digest of the input
+    they were computed from, so a changed datastring (or a new
+    PARSE_CACHE_VERSION) is just a miss and gets overwritten. Values are
+    pickled and zlib-compressed. close() records which entries were used and
+    drops the least recently used ones beyond max_bytes.
+    """
+    
+    def __init__(self, path=PARSE_CACHE_PATH, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS parsed (
+                kind TEXT NOT NULL,
+                uniqueid TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                value BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (kind, uniqueid)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS parsed_last_used ON parsed (last_used)")
+        self.now = time.time()
+        self.digests = {}
+        self.used = []
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def digest(job):
+        # sha256 is hardware accelerated on most CPUs, well ahead of blake2 here
+        h = hashlib.sha256(str(PARSE_CACHE_VERSION).encode())
+        for value in job:
+            h.update(b'\x1f' + str(value).encode())
+        return h.digest()
+    
+    def get(self, kind, job):
+        """Cached value for job, or None; remembers the digest for put()"""
+        digest = self.digest(job)
+        row = self.conn.execute("SELECT digest, value FROM parsed WHERE kind = ? AND uniqueid = ?",
+                                (kind, job[0])).fetchone()
+        if row and row[0] == digest:
+            self.hits += 1
+            self.used.append((self.now, kind, job[0]))
+            return pickle.loads(zlib.decompress(row[1]))
+        self.misses += 1
+        self.digests[kind, job[0]] = digest
+        return None
+    
+    def put(self, kind, job, value):
+        digest = self.digests.pop((kind, job[0]), None) or self.digest(job)
+        self.conn.execute("INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?)",
+                          (kind, job[0], digest,
+                           zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                                         PARSE_CACHE_COMPRESSION),
+                           self.now))
+    
+    def close(self):
+        self.conn.executemany("UPDATE parsed SET last_used = ? WHERE kind = ? AND uniqueid = ?",
+                              self.used)
+        total = 0
+        evicted = []
+        for kind, uniqueid, size in self.conn.execute(
+                "SELECT kind, uniqueid, length(value) FROM parsed ORDER BY last_used DESC"):
+            total += size
+            if total > self.max_bytes:
+                evicted.append((kind, uniqueid))
+        self.conn.executemany("DELETE FROM parsed WHERE kind = ? AND uniqueid = ?", evicted)
+        self.conn.commit()
+        self.conn.close()
+
+def open_parse_cache(use_cache=True):
+    """A ParseCache unless caching is turned off (--no-cache)"""
+    return ParseCache() if use_cache else None
+
+def create_snapshot():
+    """Copy the live database into a timestamped read-only snapshot
+    
+    Uses SQLite's online backup API a few pages per step, so participant
+    saves can keep committing between steps while the copy is taken.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    filename = os.path.join(SNAPSHOT_DIR,
+                            f"participants_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+    tmp_filename = filename + '.tmp'
+    
+    def progress(status, remaining, total):
+        print(f"\r   Copied {total - remaining}/{total} pages", end='')
+    
+    source = get_connection()
+    target = sqlite3.connect(tmp_filename)
+    try:
+        source.backup(target, pages=SNAPSHOT_PAGES_PER_STEP, progress=progress, sleep=0.005)
+        # a snapshot is a single self-contained file
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_filename, filename)
+    os.chmod(filename, 0o444)
+    
+    print(f"\n\n✅ Snapshot saved to: {filename}\n")
+    return filename
+
+def latest_snapshot():
+    """Path of the newest snapshot in SNAPSHOT_DIR, or None"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return None
+    snapshots = sorted(name for name in os.listdir(SNAPSHOT_DIR)
+                       if name.startswith('participants_') and name.endswith('.db'))
+    return os.path.join(SNAPSHOT_DIR, snapshots[-1]) if snapshots else None
 
 def list_participants():
     """List all participants"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT uniqueid, beginhit, status, mode, codeversion, endhit 
-        FROM assignments 
-        ORDER BY beginhit DESC
-    """)
+    cursor.execute(LIST_QUERY)
     
     participants = cursor.fetchall()
     
@@ -45,28 +382,151 @@ def list_participants():
     print(f"{'='*80}")
     
     for p in participants:
-        participant_id = p[0] or 'N/A'
-        start_time = p[1] or 'N/A'
-        status = p[2] or 'N/A'
-        mode = p[3] or 'N/A'
+        participant_id = p['uniqueid'] or 'N/A'
+        start_time = p['beginhit'] or 'N/A'
+        status = p['status'] or 'N/A'
+        mode = p['mode'] or 'N/A'
         print(f"{participant_id:<25} {start_time:<20} {status:<15} {mode:<10}")
     
     print(f"{'='*80}")
     print(f"Total participants: {len(participants)}\n")
     conn.close()
 
+def _datastring_records():
+    # records of a.datastring's `data` list; a malformed datastring has none
+    # instead of aborting the whole query
+    return "json_each(CASE WHEN json_valid(a.datastring) THEN a.datastring END, '$.data') r"
+
+def participant_filters(cursor, options):
+    """Compile query's filter flags into (WHERE clauses, parameters) over assignments a
+    
+    Column filters use the assignments indexes. Filters on trial content
+    (condition, phase, accuracy) read participant_summary and trials when
+    the server has created them, and SQLite's JSON1 functions over the
+    datastring otherwise, so only matching participants are ever decoded.
+    """
+    clauses = []
+    parameters = []
+    
+    if options.status:
+        codes = [int(value) if value.isdigit() else STATUS_CODES[value.lower()]
+                 for value in options.status.split(',')]
+        clauses.append(f"a.status IN ({', '.join('?' * len(codes))})")
+        parameters += codes
+    for column in ('mode', 'codeversion'):
+        if getattr(options, column):
+            clauses.append(f"a.{column} = ?")
+            parameters.append(getattr(options, column))
+    # beginhit is stored as 'YYYY-MM-DD HH:MM:SS.ffffff' and compared as text
+    if options.since:
+        clauses.append("a.beginhit >= ?")
+        parameters.append(options.since.replace('T', ' '))
+    if options.until:
+        until = options.until.replace('T', ' ')
+        try:
+            # a bare date includes that whole day
+            until = (datetime.strptime(until, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+        clauses.append("a.beginhit < ?")
+        parameters.append(until)
+    
+    summary = table_exists(cursor, SUMMARY_TABLE)
+    trials = table_exists(cursor, TRIALS_TABLE)
+    if options.condition:
+        if summary:
+            clauses.append(f"EXISTS (SELECT 1 FROM {SUMMARY_TABLE} s "
+                           f"WHERE s.uniqueid = a.uniqueid AND s.condition = ?)")
+        elif trials:
+            clauses.append(f"EXISTS (SELECT 1 FROM {TRIALS_TABLE} t WHERE t.uniqueid = a.uniqueid "
+                           f"AND t.phase = 'ASSIGNMENT' AND t.condition = ?)")
+        else:
+            clauses.append(f"EXISTS (SELECT 1 FROM {_datastring_records()} "
+                           f"WHERE json_extract(r.value, '$.trialdata.phase') = 'ASSIGNMENT' "
+                           f"AND json_extract(r.value, '$.trialdata.condition') = ?)")
+        parameters.append(options.condition)
+    if options.phase:
+        if trials:
+            clauses.append(f"EXISTS (SELECT 1 FROM {TRIALS_TABLE} t "
+                           f"WHERE t.uniqueid = a.uniqueid AND t.phase = ?)")
+        else:
+            clauses.append(f"EXISTS (SELECT 1 FROM {_datastring_records()} "
+                           f"WHERE json_extract(r.value, '$.trialdata.phase') = ?)")
+        parameters.append(options.phase)
+    
+    if options.min_accuracy is not None or options.max_accuracy is not None:
+        # fraction of TEST trials (with a question_id) answered correctly;
+        # NULL, so never matched, for participants without any
+        if summary:
+            accuracy = (f"(SELECT CAST(s.n_correct AS REAL) / s.n_trials FROM {SUMMARY_TABLE} s "
+                        f"WHERE s.uniqueid = a.uniqueid AND s.n_trials > 0)")
+        elif trials:
+            accuracy = (f"(SELECT AVG(t.correct = 1) FROM {TRIALS_TABLE} t WHERE t.uniqueid = a.uniqueid "
+                        f"AND t.phase = 'TEST' AND t.question_id IS NOT NULL)")
+        else:
+            accuracy = (f"(SELECT AVG(json_extract(r.value, '$.trialdata.correct') = 1) "
+                        f"FROM {_datastring_records()} "
+                        f"WHERE json_extract(r.value, '$.trialdata.phase') = 'TEST' "
+                        f"AND json_type(r.value, '$.trialdata.question_id') IS NOT NULL)")
+        if options.min_accuracy is not None:
+            clauses.append(f"{accuracy} >= ?")
+            parameters.append(options.min_accuracy)
+        if options.max_accuracy is not None:
+            clauses.append(f"{accuracy} <= ?")
+            parameters.append(options.max_accuracy)
+    
+    return clauses, parameters
+
+def query_participants(options):
+    """List participants matching the query filters, or print their data as NDJSON"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        clauses, parameters = participant_filters(cursor, options)
+    except KeyError as e:
+        print(f"Unknown status {e}; use a number or one of: {', '.join(STATUS_CODES)}")
+        conn.close()
+        return
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    
+    if options.ndjson:
+        cursor.row_factory = None
+        cursor.execute(f"SELECT {select_columns(['a.' + c for c in PARTICIPANT_COLUMNS])} "
+                       f"FROM assignments a {where} ORDER BY a.beginhit DESC", parameters)
+        cache = open_parse_cache(options.use_cache)
+        encode = functools.partial(_encode_participant, ndjson=True)
+        for row, text, error in map_cached(encode, 'ndjson', cursor,
+                                           workers=options.workers, cache=cache):
+            if error is not None:
+                print(f"Error processing participant {row[0]}: {error}", file=sys.stderr)
+                continue
+            sys.stdout.write(text)
+        if cache:
+            cache.close()
+        conn.close()
+        return
+    
+    cursor.execute(f"SELECT {select_columns(['a.' + c for c in LIST_COLUMNS])} "
+                   f"FROM assignments a {where} ORDER BY a.beginhit DESC", parameters)
+    participants = cursor.fetchall()
+    conn.close()
+    
+    print(f"\n{'='*80}")
+    print(f"{'Participant ID':<25} {'Started':<20} {'Status':<8} {'Mode':<10} {'Code version':<15}")
+    print(f"{'='*80}")
+    for p in participants:
+        print(f"{p['uniqueid'] or 'N/A':<25} {p['beginhit'] or 'N/A':<20} "
+              f"{p['status'] if p['status'] is not None else 'N/A':<8} "
+              f"{p['mode'] or 'N/A':<10} {p['codeversion'] or 'N/A':<15}")
+    print(f"{'='*80}")
+    print(f"Matching participants: {len(participants)}\n")
+
 def get_participant_data(participant_id):
-    """Get detailed data for a specific participant"""
+    """Get the assignments row for a specific participant, or None"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT uniqueid, assignmentid, workerid, hitid, ipaddress, browser, 
-               platform, language, cond, counterbalance, codeversion, beginhit, 
-               beginexp, endhit, bonus, status, datastring, mode
-        FROM assignments 
-        WHERE uniqueid = ?
-    """, (participant_id,))
+    cursor.execute(PARTICIPANT_QUERY, (participant_id,))
     
     result = cursor.fetchone()
     conn.close()
@@ -75,15 +535,15 @@ def get_participant_data(participant_id):
         print(f"Participant {participant_id} not found.")
         return None
     
-    columns = ['uniqueid', 'assignmentid', 'workerid', 'hitid', 'ipaddress', 'browser',
-               'platform', 'language', 'cond', 'counterbalance', 'codeversion', 'beginhit',
-               'beginexp', 'endhit', 'bonus', 'status', 'datastring', 'mode']
-    
-    participant = dict(zip(columns, result))
+    return result
+
+def decode_participant(row):
+    """Turn an assignments row (or a dict of one) into a dict with its datastring decoded"""
+    participant = dict(row)
     
     # Parse datastring JSON which contains questiondata and eventdata
     if participant['datastring']:
-        datastring = json.loads(participant['datastring'])
+        datastring = loads(participant['datastring'])
         participant['datastring'] = datastring
         # Extract questiondata and eventdata from datastring
         participant['questiondata'] = datastring.get('questiondata', {})
@@ -101,6 +561,12 @@ def show_participant(participant_id):
     if not data:
         return
     
+    parsed = None
+    if data['datastring']:
+        parsed, error = _parse_job((data['uniqueid'], data['datastring']))
+        if error is not None:
+            print(f"Error processing participant {participant_id}: {error}")
+    
     print(f"\n{'='*80}")
     print(f"PARTICIPANT: {participant_id}")
     print(f"{'='*80}\n")
@@ -114,233 +580,623 @@ def show_participant(participant_id):
     print(f"  Ended: {data['endhit']}")
     print(f"  Bonus: ${data['bonus']}")
     
+    conditions, trial_rows, questiondata, questionnaire = parsed or ((), [], {}, {})
+    
     print("\nDEMOGRAPHICS:")
-    if data['questiondata']:
-        for key, value in data['questiondata'].items():
+    if questiondata:
+        for key, value in questiondata.items():
             print(f"  {key}: {value}")
     else:
         print("  No demographics data")
     
     print("\nTRIAL DATA:")
-    if data['datastring'] and 'data' in data['datastring']:
-        trials = [t for t in data['datastring']['data'] 
-                 if t.get('trialdata', {}).get('phase') == 'TEST']
-        print(f"  Total trials: {len(trials)}")
+    if parsed:
+        print(f"  Total trials: {len(trial_rows)}")
         
-        if trials:
-            correct = sum(1 for t in trials if t.get('trialdata', {}).get('correct'))
-            print(f"  Correct answers: {correct}/{len(trials)}")
-            print(f"  Accuracy: {correct/len(trials)*100:.1f}%")
+        if trial_rows:
+            correct = sum(1 for row in trial_rows if row[CORRECT_INDEX])
+            print(f"  Correct answers: {correct}/{len(trial_rows)}")
+            print(f"  Accuracy: {correct/len(trial_rows)*100:.1f}%")
     else:
         print("  No trial data")
     
     print("\nQUESTIONNAIRE DATA:")
-    if data['datastring'] and 'data' in data['datastring']:
-        quest = [t for t in data['datastring']['data'] 
-                if t.get('trialdata', {}).get('phase') == 'postquestionnaire']
-        if quest:
-            for q in quest:
-                survey = q.get('trialdata', {}).get('survey')
-                if survey:
-                    survey_data = json.loads(survey)
-                    for key, value in survey_data.items():
-                        print(f"  {key}: {value}")
-        else:
-            print("  No questionnaire data")
+    if questionnaire:
+        for key, value in questionnaire.items():
+            print(f"  {key}: {value}")
     else:
         print("  No questionnaire data")
     
     print(f"\n{'='*80}\n")
 
-def export_to_csv():
-    """Export data to separate CSV files"""
+TRIAL_COLUMNS = ['participant_id', 'condition', 'trial_index', 'question_id',
+                 'question_text', 'correct_answer', 'response', 'correct',
+                 'difficulty', 'rt', 'feedback_type', 'timestamp']
+QUESTIONNAIRE_COLUMNS = ['participant_id', 'condition', 'engagement_q1', 'engagement_q2',
+                         'usability_q1', 'usability_q2', 'adaptiveness_q1',
+                         'adaptiveness_q2', 'satisfaction_overall', 'general_comments']
+DEMOGRAPHICS_COLUMNS = ['participant_id', 'condition', 'age', 'gender',
+                        'psiturk_exp', 'robot_exp', 'browser', 'platform',
+                        'started', 'completed', 'bonus']
+CORRECT_INDEX = TRIAL_COLUMNS.index('correct')
+
+def parse_datastring(uniqueid, datastring):
+    """Walk one datastring: (conditions, trial rows, questiondata, questionnaire)
+    
+    conditions lists the condition of every ASSIGNMENT record in order;
+    trial rows are TRIAL_COLUMNS tuples for TEST records with a
+    question_id; questionnaire is the decoded post-questionnaire survey
+    ({} if none). This depends on the datastring alone.
+    """
+    data = loads(datastring)
+    conditions = []
+    questionnaire = {}
+    trial_rows = []
+    
+    for record in data.get('data', []):
+        trial = record.get('trialdata', {})
+        phase = trial.get('phase', '')
+        
+        if phase == 'ASSIGNMENT':
+            conditions.append(trial.get('condition', 'unknown'))
+        
+        elif phase == 'TEST' and 'question_id' in trial:
+            trial_rows.append((
+                uniqueid,
+                (conditions[-1] if conditions else None) or 'unknown',
+                trial.get('trial_index'),
+                trial.get('question_id'),
+                trial.get('question_text'),
+                trial.get('correct_answer'),
+                trial.get('response'),
+                trial.get('correct'),
+                trial.get('difficulty'),
+                trial.get('rt'),
+                trial.get('feedback_type'),
+                record.get('dateTime')
+            ))
+        
+        elif phase == 'postquestionnaire':
+            survey_str = trial.get('survey', '{}')
+            try:
+                questionnaire = loads(survey_str)
+            except (TypeError, ValueError):
+                pass
+    
+    return tuple(conditions), trial_rows, data.get('questiondata', {}), questionnaire
+
+def _parse_job(job):
+    """Worker: (uniqueid, datastring) -> (parse_datastring result, error)"""
+    try:
+        return parse_datastring(*job), None
+    except Exception as e:
+        return None, str(e)
+
+def shape_participant(p, parsed=None):
+    """Turn an EXPORT_COLUMNS row into (trial rows, questionnaire row, demographics row)
+    
+    Rows are tuples in TRIAL_COLUMNS / QUESTIONNAIRE_COLUMNS /
+    DEMOGRAPHICS_COLUMNS order with missing values as None. The
+    questionnaire row is None when the participant never submitted the
+    survey. parsed is the participant's parse_datastring result, if
+    already known.
+    """
+    participant_id = p['uniqueid']
+    if parsed is None:
+        parsed = parse_datastring(participant_id, p['datastring'])
+    conditions, trial_rows, demographics, questionnaire = parsed
+    condition = conditions[-1] if conditions else None
+    
+    demo_row = (
+        participant_id,
+        condition or 'unknown',
+        demographics.get('age'),
+        demographics.get('gender'),
+        demographics.get('psiturk_exp'),
+        demographics.get('robot_exp'),
+        p['browser'],
+        p['platform'],
+        p['beginhit'],
+        p['endhit'],
+        p['bonus']
+    )
+    
+    # Questionnaire row only if the survey was submitted
+    quest_row = None
+    if questionnaire:
+        quest_row = (
+            participant_id,
+            condition or 'unknown',
+            questionnaire.get('engagement_q1'),
+            questionnaire.get('engagement_q2'),
+            questionnaire.get('usability_q1'),
+            questionnaire.get('usability_q2'),
+            questionnaire.get('adaptiveness_q1'),
+            questionnaire.get('adaptiveness_q2'),
+            questionnaire.get('satisfaction_overall'),
+            demographics.get('general_comments')
+        )
+    
+    return trial_rows, quest_row, demo_row
+
+def ensure_change_log(conn):
+    """Create the assignments change log if the server hasn't yet (live database only)"""
+    cursor = conn.cursor()
+    if SNAPSHOT_PATH:
+        if not table_exists(cursor, CHANGES_TABLE):
+            raise SystemExit(f"{SNAPSHOT_PATH} has no {CHANGES_TABLE} table; run "
+                             f"`query_data.py migrate` on the live database and snapshot again.")
+        return
+    with conn:
+        for statement in CHANGE_LOG_DDL:
+            cursor.execute(statement)
+
+def select_export_rows(cursor, incremental, kind):
+    """Run the export query and return the change_seq an incremental export ends at
+    
+    Incremental exports select finished participants whose latest change is
+    after the `kind` watermark, as EXPORT_COLUMNS plus change_seq.
+    """
+    if incremental:
+        ensure_change_log(cursor.connection)
+        # pinned now, so rows changing mid-export wait for the next run
+        upper = cursor.execute(f"SELECT COALESCE(MAX(change_seq), 0) "
+                               f"FROM {CHANGES_TABLE}").fetchone()[0]
+        cursor.execute(INCREMENTAL_EXPORT_QUERY, (load_watermark(kind), upper))
+        return upper
+    columns = select_columns(EXPORT_COLUMNS)
+    cursor.execute(f"SELECT {columns} FROM assignments WHERE datastring IS NOT NULL")
+    return None
+
+def iter_shaped(rows, workers=None, columns=EXPORT_COLUMNS):
+    """Yield (row dict, shaped participant) for each row tuple, skipping bad datastrings
+    
+    Rows hold `columns`, EXPORT_COLUMNS by default. Datastrings are parsed
+    in `workers` processes.
+    """
+    participants = (dict(zip(columns, row)) for row in rows)
+    for p, parsed, error in map_cached(_parse_job, 'parsed', participants,
+                                       job=lambda p: (p['uniqueid'], p['datastring']),
+                                       workers=workers):
+        if error is not None:
+            print(f"Error processing participant {p['uniqueid']}: {error}")
+            continue
+        yield p, shape_participant(p, parsed)
+
+def export_columns(columns, incremental):
+    """Output header: incremental files end with the change_seq each row was exported at"""
+    return columns + ['change_seq'] if incremental else columns
+
+def open_csv_output(filename, header, append):
+    """Open a CSV output, writing the header unless appending to an existing file"""
+    write_header = not (append and os.path.exists(filename) and os.path.getsize(filename) > 0)
+    f = open(filename, 'a' if append else 'w', newline='')
+    writer = csv.writer(f)
+    if write_header:
+        writer.writerow(header)
+    return f, writer
+
+def rewind_csv_outputs(filenames, sizes):
+    """Cut incremental CSVs back to the sizes saved with the watermark
+    
+    Drops whatever a run that died before saving its watermark appended,
+    including a half-written last row, so the redone run doesn't duplicate it.
+    """
+    if sizes is None:
+        return
+    for filename in filenames:
+        size = sizes.get(filename, 0)
+        if os.path.exists(filename) and os.path.getsize(filename) > size:
+            print(f"Dropping {os.path.getsize(filename) - size} byte(s) of {filename} "
+                  f"written after the last watermark")
+            with open(filename, 'r+b') as f:
+                f.truncate(size)
+
+def sync_output(f):
+    """Flush f through to disk before a watermark says it's there"""
+    f.flush()
+    os.fsync(f.fileno())
+
+def export_to_csv(incremental=False, workers=None):
+    """Export data to separate CSV files
+    
+    With incremental=True only finished participants (see FINISHED_STATUSES)
+    whose record changed after the stored watermark are decoded, and their
+    rows are appended to fixed-name CSV files with a trailing change_seq
+    column. Participants still in progress are picked up by the first run
+    after they finish. A participant who changes again later (e.g. a bonus
+    recompute) is appended again with a higher change_seq; their rows with
+    the highest change_seq are current. The watermark is saved with the
+    files' sizes after they are synced, and the next run truncates them back
+    to those sizes, so a run that dies part way is redone without
+    duplicates. With workers, datastrings are decoded in that many
+    processes; rows are still written in order.
+    """
     conn = get_connection()
     cursor = conn.cursor()
+    # plain tuples in EXPORT_COLUMNS order, picklable for --workers
+    cursor.row_factory = None
+    upper = select_export_rows(cursor, incremental, 'csv')
+    columns = export_columns(EXPORT_COLUMNS, incremental)
     
-    cursor.execute("SELECT * FROM assignments")
-    participants = cursor.fetchall()
-    conn.close()
+    if incremental:
+        trial_filename = "trial_data.csv"
+        quest_filename = "questionnaire_data.csv"
+        demo_filename = "demographics_data.csv"
+        rewind_csv_outputs([trial_filename, quest_filename, demo_filename],
+                           recorded_sizes('csv'))
+    else:
+        trial_filename = f"trial_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        quest_filename = f"questionnaire_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        demo_filename = f"demographics_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     
-    if not participants:
-        print("No participants found.")
+    first = cursor.fetchone()
+    if first is None:
+        conn.close()
+        print("No new participants since last export." if incremental else "No participants found.")
         return
     
-    # Create trial data CSV
-    trial_filename = f"trial_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    quest_filename = f"questionnaire_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    demo_filename = f"demographics_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    exported = 0
+    trial_file, trial_writer = open_csv_output(
+        trial_filename, export_columns(TRIAL_COLUMNS, incremental), incremental)
+    quest_file, quest_writer = open_csv_output(
+        quest_filename, export_columns(QUESTIONNAIRE_COLUMNS, incremental), incremental)
+    demo_file, demo_writer = open_csv_output(
+        demo_filename, export_columns(DEMOGRAPHICS_COLUMNS, incremental), incremental)
+    with trial_file, quest_file, demo_file:
+        # csv writes None as an empty field
+        for p, (trial_rows, quest_row, demo_row) in iter_shaped(
+                itertools.chain([first], cursor), workers, columns):
+            if incremental:
+                marker = (p['change_seq'],)
+                trial_rows = [row + marker for row in trial_rows]
+                demo_row += marker
+                quest_row = quest_row and quest_row + marker
+            trial_writer.writerows(trial_rows)
+            demo_writer.writerow(demo_row)
+            if quest_row:
+                quest_writer.writerow(quest_row)
+            exported += 1
+        if incremental:
+            for f in (trial_file, quest_file, demo_file):
+                sync_output(f)
+    conn.close()
     
-    with open(trial_filename, 'w', newline='') as trial_file:
-        trial_writer = csv.writer(trial_file)
-        trial_writer.writerow(['participant_id', 'condition', 'trial_index', 'question_id',
-                              'question_text', 'correct_answer', 'response', 'correct',
-                              'difficulty', 'rt', 'feedback_type', 'timestamp'])
-        
-        with open(quest_filename, 'w', newline='') as quest_file:
-            quest_writer = csv.writer(quest_file)
-            quest_writer.writerow(['participant_id', 'condition', 'engagement_q1', 'engagement_q2',
-                                  'usability_q1', 'usability_q2', 'adaptiveness_q1',
-                                  'adaptiveness_q2', 'satisfaction_overall', 'general_comments'])
-            
-            with open(demo_filename, 'w', newline='') as demo_file:
-                demo_writer = csv.writer(demo_file)
-                demo_writer.writerow(['participant_id', 'condition', 'age', 'gender',
-                                      'psiturk_exp', 'robot_exp', 'browser', 'platform',
-                                      'started', 'completed', 'bonus'])
-                
-                for p in participants:
-                    participant_id = p[0]
-                    datastring_raw = p[17]  # datastring column
-                    browser = p[5]
-                    platform = p[6]
-                    beginhit = p[11]
-                    endhit = p[13]
-                    bonus = p[14]
-                    
-                    if not datastring_raw:
-                        continue
-                    
-                    try:
-                        data = json.loads(datastring_raw)
-                        condition = None
-                        demographics = data.get('questiondata', {})
-                        questionnaire = {}
-                        
-                        # Extract trial data
-                        for record in data.get('data', []):
-                            trial = record.get('trialdata', {})
-                            phase = trial.get('phase', '')
-                            
-                            if phase == 'ASSIGNMENT':
-                                condition = trial.get('condition', 'unknown')
-                            
-                            elif phase == 'TEST' and 'question_id' in trial:
-                                trial_writer.writerow([
-                                    participant_id,
-                                    condition or 'unknown',
-                                    trial.get('trial_index', ''),
-                                    trial.get('question_id', ''),
-                                    trial.get('question_text', ''),
-                                    trial.get('correct_answer', ''),
-                                    trial.get('response', ''),
-                                    trial.get('correct', ''),
-                                    trial.get('difficulty', ''),
-                                    trial.get('rt', ''),
-                                    trial.get('feedback_type', ''),
-                                    record.get('dateTime', '')
-                                ])
-                            
-                            elif phase == 'postquestionnaire':
-                                survey_str = trial.get('survey', '{}')
-                                try:
-                                    questionnaire = json.loads(survey_str)
-                                except:
-                                    pass
-                        
-                        # Write demographics row
-                        demo_writer.writerow([
-                            participant_id,
-                            condition or 'unknown',
-                            demographics.get('age', ''),
-                            demographics.get('gender', ''),
-                            demographics.get('psiturk_exp', ''),
-                            demographics.get('robot_exp', ''),
-                            browser,
-                            platform,
-                            beginhit,
-                            endhit,
-                            bonus
-                        ])
-                        
-                        # Write questionnaire row (only if data exists)
-                        if questionnaire:
-                            quest_writer.writerow([
-                                participant_id,
-                                condition or 'unknown',
-                                questionnaire.get('engagement_q1', ''),
-                                questionnaire.get('engagement_q2', ''),
-                                questionnaire.get('usability_q1', ''),
-                                questionnaire.get('usability_q2', ''),
-                                questionnaire.get('adaptiveness_q1', ''),
-                                questionnaire.get('adaptiveness_q2', ''),
-                                questionnaire.get('satisfaction_overall', ''),
-                                demographics.get('general_comments', '')
-                            ])
-                        
-                    except Exception as e:
-                        print(f"Error processing participant {participant_id}: {e}")
-                        continue
-    
-    print(f"\n✅ Data exported successfully!")
+    if incremental:
+        save_watermark('csv', upper, {filename: os.path.getsize(filename) for filename in
+                                      (trial_filename, quest_filename, demo_filename)})
+        print(f"\n✅ {exported} new or changed participant(s) appended!")
+    else:
+        print("\n✅ Data exported successfully!")
     print(f"   Trial data: {trial_filename}")
     print(f"   Questionnaire data: {quest_filename}")
     print(f"   Demographics data: {demo_filename}\n")
 
-def export_to_json():
-    """Export all data to JSON"""
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 64 * 1024
+
+def _as_int(value):
+    """Best-effort int for form fields stored as strings; None if not a number"""
+    if isinstance(value, bool):
+        return int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _as_bool(value):
+    return value if isinstance(value, bool) else None
+
+def _as_str(value):
+    return None if value is None else str(value)
+
+def _as_datetime(value):
+    """psiTurk's 'YYYY-MM-DD HH:MM:SS.ffffff' column text as a datetime; None if unparseable"""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def parquet_tables(incremental=False):
+    """(name, pyarrow schema, per-column converters, dictionary columns) for each output
+    
+    Incremental outputs end with a change_seq column, as in export-csv.
+    """
+    import pyarrow as pa
+    
+    trial_types = [
+        ('participant_id', pa.string(), _as_str), ('condition', pa.string(), _as_str),
+        ('trial_index', pa.int32(), _as_int), ('question_id', pa.string(), _as_str),
+        ('question_text', pa.string(), _as_str), ('correct_answer', pa.string(), _as_str),
+        ('response', pa.string(), _as_str), ('correct', pa.bool_(), _as_bool),
+        ('difficulty', pa.string(), _as_str), ('rt', pa.float64(), _as_float),
+        ('feedback_type', pa.string(), _as_str), ('timestamp', pa.timestamp('ms'), _as_int),
+    ]
+    quest_types = [
+        ('participant_id', pa.string(), _as_str), ('condition', pa.string(), _as_str),
+    ] + [(column, pa.int8(), _as_int) for column in QUESTIONNAIRE_COLUMNS[2:-1]] + [
+        ('general_comments', pa.string(), _as_str),
+    ]
+    demo_types = [
+        ('participant_id', pa.string(), _as_str), ('condition', pa.string(), _as_str),
+        ('age', pa.int16(), _as_int), ('gender', pa.string(), _as_str),
+        ('psiturk_exp', pa.string(), _as_str), ('robot_exp', pa.string(), _as_str),
+        ('browser', pa.string(), _as_str), ('platform', pa.string(), _as_str),
+        ('started', pa.timestamp('us'), _as_datetime),
+        ('completed', pa.timestamp('us'), _as_datetime),
+        ('bonus', pa.float64(), _as_float),
+    ]
+    # low-cardinality strings that compress well as dictionaries
+    dictionary = ['participant_id', 'condition', 'question_id', 'question_text',
+                  'correct_answer', 'difficulty', 'feedback_type', 'gender',
+                  'psiturk_exp', 'robot_exp', 'browser', 'platform']
+    
+    tables = []
+    for name, types in (('trials', trial_types), ('questionnaire', quest_types),
+                        ('demographics', demo_types)):
+        if incremental:
+            types = types + [('change_seq', pa.int64(), _as_int)]
+        schema = pa.schema([(column, arrow_type) for column, arrow_type, _ in types])
+        converters = [convert for _, _, convert in types]
+        tables.append((name, schema, converters,
+                       [column for column in schema.names if column in dictionary]))
+    return tables
+
+class ParquetBatchWriter:
+    """Buffers row tuples and writes them to a Parquet file one row group at a time"""
+    
+    def __init__(self, filename, schema, converters, dictionary_columns, compression):
+        import pyarrow.parquet as pq
+        self.schema = schema
+        self.converters = converters
+        self.rows = []
+        self.writer = pq.ParquetWriter(filename, schema, compression=compression,
+                                       use_dictionary=dictionary_columns)
+    
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_ROW_GROUP_SIZE:
+            self.flush()
+    
+    def flush(self):
+        import pyarrow as pa
+        if not self.rows:
+            return
+        columns = zip(*self.rows)
+        arrays = [pa.array([convert(value) for value in values], type=field.type)
+                  for values, convert, field in zip(columns, self.converters, self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+    
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def export_to_parquet(incremental=False, compression='zstd', workers=None):
+    """Export trials, questionnaire and demographics as typed Parquet files
+    
+    Each run writes one part file per table into parquet_export/<table>/ for
+    incremental runs (so the directories are appendable datasets), or into a
+    fresh parquet_export_<timestamp>/ otherwise. Incremental runs pick
+    participants and add change_seq the same way export-csv does. Their
+    parts are written under temporary names that dataset readers skip,
+    renamed to part-<watermark they start after>.parquet once all three are
+    complete, and only then is the watermark saved; a run redone after a
+    crash replaces its parts instead of adding duplicates. Rows are
+    converted to typed Arrow columns and written a row group at a time
+    while streaming.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit("export-parquet needs the pyarrow package: pip install pyarrow")
+    
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.row_factory = None
+    upper = select_export_rows(cursor, incremental, 'parquet')
+    columns = export_columns(EXPORT_COLUMNS, incremental)
     
-    cursor.execute("SELECT * FROM assignments")
-    participants = cursor.fetchall()
-    conn.close()
+    first = cursor.fetchone()
+    if first is None:
+        conn.close()
+        print("No new participants since last export." if incremental else "No participants found.")
+        return
     
-    all_data = []
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    out_dir = 'parquet_export' if incremental else f'parquet_export_{stamp}'
+    # named after the watermark they start at, so a redone run replaces them
+    part = f'part-{load_watermark("parquet"):012d}' if incremental else f'part-{stamp}'
+    writers, renames = [], []
+    for name, schema, converters, dictionary_columns in parquet_tables(incremental):
+        os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+        filename = os.path.join(out_dir, name, f'{part}.parquet')
+        if incremental:
+            # a leading underscore hides the unfinished part from dataset readers
+            renames.append((os.path.join(out_dir, name, f'_{part}.parquet.tmp'), filename))
+            filename = renames[-1][0]
+        writers.append(ParquetBatchWriter(filename, schema, converters,
+                                          dictionary_columns, compression))
+    trial_writer, quest_writer, demo_writer = writers
     
-    for p in participants:
-        participant_id = p[0]
-        data = get_participant_data(participant_id)
-        if data:
-            all_data.append(data)
+    exported = 0
+    try:
+        for p, (trial_rows, quest_row, demo_row) in iter_shaped(
+                itertools.chain([first], cursor), workers, columns):
+            if incremental:
+                marker = (p['change_seq'],)
+                trial_rows = [row + marker for row in trial_rows]
+                demo_row += marker
+                quest_row = quest_row and quest_row + marker
+            for row in trial_rows:
+                trial_writer.write(row)
+            demo_writer.write(demo_row)
+            if quest_row:
+                quest_writer.write(quest_row)
+            exported += 1
+    finally:
+        for writer in writers:
+            writer.close()
+        conn.close()
     
-    filename = f"all_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    if incremental:
+        for tmp_path, filename in renames:
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, filename)
+        save_watermark('parquet', upper)
+    print(f"\n✅ {exported} participant(s) exported to: {out_dir}/{{trials,questionnaire,demographics}}\n")
+
+# file suffix for each --compress choice
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def open_text_output(filename, compress=None):
+    """Open filename for writing text, compressing on the fly if asked"""
+    if compress == 'gzip':
+        return gzip.open(filename, 'wt', encoding='utf-8')
+    if compress == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit("--compress zstd needs the zstandard package: pip install zstandard")
+        raw = open(filename, 'wb')
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw), encoding='utf-8')
+    return open(filename, 'w')
+
+def _encode_participant(row, ndjson=False):
+    """Worker: PARTICIPANT_COLUMNS tuple -> (JSON text, error)"""
+    try:
+        data = decode_participant(dict(zip(PARTICIPANT_COLUMNS, row)))
+    except ValueError as e:
+        return None, str(e)
+    if ndjson:
+        return json.dumps(data, separators=(',', ':')) + '\n', None
+    return textwrap.indent(json.dumps(data, indent=2), '  '), None
+
+def export_to_json(ndjson=False, compress=None, workers=None, use_cache=True):
+    """Export all data to JSON
+    
+    One query over one connection; each participant is decoded and written
+    as soon as it is read, so only one participant is in memory at a time
+    (one batch per worker with workers). With ndjson=True each participant
+    is one compact line instead of an element of an indented array. The
+    encoded text of participants whose row hasn't changed since the last
+    export comes from the parse cache.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    
+    cursor.execute(f"SELECT {select_columns(PARTICIPANT_COLUMNS)} FROM assignments")
+    
+    extension = 'ndjson' if ndjson else 'json'
+    filename = (f"all_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+                f"{COMPRESSION_SUFFIXES[compress]}")
     
-    with open(filename, 'w') as f:
-        json.dump(all_data, f, indent=2)
+    count = 0
+    cache = open_parse_cache(use_cache)
+    with open_text_output(filename, compress) as f:
+        if not ndjson:
+            # same layout as json.dump(all_data, f, indent=2), written element by element
+            f.write('[')
+        encode = functools.partial(_encode_participant, ndjson=ndjson)
+        for row, text, error in map_cached(encode, extension, cursor,
+                                           workers=workers, cache=cache):
+            if error is not None:
+                print(f"Error processing participant {row[0]}: {error}")
+                continue
+            if not ndjson:
+                f.write(',\n' if count else '\n')
+            f.write(text)
+            count += 1
+        if not ndjson:
+            f.write('\n]' if count else ']')
+    if cache:
+        cache.close()
+    conn.close()
+    
+    print(f"\n✅ {count} participant(s) exported to: {filename}\n")
+
+def summary_stats(cursor):
+    """(total, completed, conditions, trials, correct, missing) from participant_summary
     
-    print(f"\n✅ Data exported to: {filename}\n")
+    One aggregate query grouped by condition; missing is the number of
+    assignments without a summary row (saved before the table existed).
+    """
+    cursor.execute(SUMMARY_STATS_QUERY, COMPLETED_STATUSES)
+    summarized = completed = total_trials = total_correct = 0
+    conditions = {'adaptive': 0, 'static': 0, 'unknown': 0}
+    total = None
+    for row in cursor:
+        summarized += row['participants']
+        completed += row['completed']
+        total_trials += row['trials']
+        total_correct += row['correct']
+        total = row['assignments']
+        if row['condition'] is not None:
+            conditions[row['condition']] = conditions.get(row['condition'], 0) + row['participants']
+    if total is None:
+        # empty summary table
+        total = cursor.execute("SELECT COUNT(*) FROM assignments").fetchone()[0]
+    return total, completed, conditions, total_trials, total_correct, total - summarized
 
-def show_stats():
-    """Show summary statistics"""
+def show_stats(workers=None):
+    """Show summary statistics
+    
+    Read from participant_summary when the server has created it;
+    otherwise every datastring is decoded.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT COUNT(*) FROM assignments")
-    total = cursor.fetchone()[0]
+    if table_exists(cursor, SUMMARY_TABLE):
+        total, completed, conditions, total_trials, total_correct, missing = summary_stats(cursor)
+        conn.close()
+        print_stats(total, completed, conditions, total_trials, total_correct)
+        if missing > 0:
+            print(f"Note: {missing} participant(s) have no {SUMMARY_TABLE} row yet; "
+                  f"run backfill-trials and summary-refresh to include them.\n")
+        return
     
-    cursor.execute("SELECT COUNT(*) FROM assignments WHERE status = 'complete'")
-    completed = cursor.fetchone()[0]
+    placeholders = ', '.join('?' * len(COMPLETED_STATUSES))
+    cursor.execute(f"""
+        SELECT COUNT(*) AS total,
+               COUNT(CASE WHEN status IN ({placeholders}) THEN 1 END) AS completed
+        FROM assignments
+    """, COMPLETED_STATUSES)
+    counts = cursor.fetchone()
+    total = counts['total']
+    completed = counts['completed']
     
-    cursor.execute("SELECT * FROM assignments")
-    participants = cursor.fetchall()
+    cursor.row_factory = None
+    cursor.execute("SELECT uniqueid, datastring FROM assignments WHERE datastring IS NOT NULL")
     
     total_trials = 0
     total_correct = 0
     conditions = {'adaptive': 0, 'static': 0, 'unknown': 0}
     
-    for p in participants:
-        datastring = p[16]
-        if datastring:
-            try:
-                data = json.loads(datastring)
-                condition = None
-                
-                for record in data.get('data', []):
-                    trial = record.get('trialdata', {})
-                    
-                    if trial.get('phase') == 'ASSIGNMENT':
-                        condition = trial.get('condition', 'unknown')
-                        conditions[condition] = conditions.get(condition, 0) + 1
-                    
-                    elif trial.get('phase') == 'TEST' and 'question_id' in trial:
-                        total_trials += 1
-                        if trial.get('correct'):
-                            total_correct += 1
-            except:
-                pass
+    for parsed, error in map_rows(_parse_job, cursor, workers):
+        if error is not None:
+            continue
+        assigned, trial_rows, _, _ = parsed
+        for condition in assigned:
+            conditions[condition] = conditions.get(condition, 0) + 1
+        total_trials += len(trial_rows)
+        total_correct += sum(1 for row in trial_rows if row[CORRECT_INDEX])
     
     conn.close()
-    
+    print_stats(total, completed, conditions, total_trials, total_correct)
+
+def print_stats(total, completed, conditions, total_trials, total_correct):
+    """Print the stats report"""
     print(f"\n{'='*80}")
     print("EXPERIMENT STATISTICS")
     print(f"{'='*80}\n")
@@ -349,12 +1205,12 @@ def show_stats():
     print(f"Completed: {completed}")
     print(f"In Progress: {total - completed}")
     
-    print(f"\nCondition Distribution:")
+    print("\nCondition Distribution:")
     for cond, count in conditions.items():
         if count > 0:
             print(f"  {cond.capitalize()}: {count}")
     
-    print(f"\nTrial Performance:")
+    print("\nTrial Performance:")
     print(f"  Total trials: {total_trials}")
     print(f"  Correct answers: {total_correct}")
     if total_trials > 0:
@@ -362,32 +1218,326 @@ def show_stats():
     
     print(f"\n{'='*80}\n")
 
+def _participant_bonus(row):
+    """Worker: (uniqueid, datastring) -> (bonus, uniqueid), bonus None if undecodable"""
+    uniqueid, datastring = row
+    try:
+        records = loads(datastring).get('data', [])
+    except ValueError:
+        return None, uniqueid
+    return bonus_for_records(records), uniqueid
+
+def recompute_bonuses(workers=None):
+    """Recompute all bonuses in parallel and write them back in one transaction
+    
+    Datastrings are streamed from the database in DECODE_BATCH_SIZE batches and
+    decoded across a process pool; only the (bonus, uniqueid) pairs are kept
+    until the single executemany UPDATE at the end. Returns the number of
+    participants updated.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    # plain tuples: rows are pickled across to the worker processes
+    cursor.row_factory = None
+    cursor.execute("SELECT uniqueid, datastring FROM assignments WHERE datastring IS NOT NULL")
+    
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    updates = []
+    failed = 0
+    for bonus, uniqueid in map_rows(_participant_bonus, cursor, workers):
+        if bonus is None:
+            print(f"Error processing participant {uniqueid}: invalid datastring")
+            failed += 1
+        else:
+            updates.append((bonus, uniqueid))
+    decoded = time.perf_counter()
+    
+    with conn:
+        conn.executemany("UPDATE assignments SET bonus = ? WHERE uniqueid = ?", updates)
+        if table_exists(conn.cursor(), SUMMARY_TABLE):
+            conn.executemany(f"UPDATE {SUMMARY_TABLE} SET bonus = ? WHERE uniqueid = ?", updates)
+    conn.close()
+    elapsed = time.perf_counter() - start
+    
+    rate = len(updates) / elapsed if elapsed > 0 else float('inf')
+    print(f"\n✅ Recomputed {len(updates)} bonus(es) in {elapsed:.2f}s "
+          f"({rate:.0f} participants/s, decode {decoded - start:.2f}s, "
+          f"write {elapsed - (decoded - start):.2f}s)")
+    if failed:
+        print(f"   Skipped {failed} participant(s) with unreadable data")
+    print()
+    return len(updates)
+
+def parse_args(argv):
+    """Parse the command line; returns None when usage should be printed"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('command', nargs='?')
+    parser.add_argument('args', nargs='*')
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--snapshot', nargs='?', const='latest', default=None)
+    parser.add_argument('--ndjson', action='store_true')
+    parser.add_argument('--compress', choices=['gzip', 'zstd'], default=None)
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false')
+    # query filters
+    parser.add_argument('--condition')
+    parser.add_argument('--status')
+    parser.add_argument('--mode')
+    parser.add_argument('--codeversion')
+    parser.add_argument('--since')
+    parser.add_argument('--until')
+    parser.add_argument('--phase')
+    parser.add_argument('--min-accuracy', type=float, default=None)
+    parser.add_argument('--max-accuracy', type=float, default=None)
+    parser.add_argument('-h', '--help', action='store_true')
+    options = parser.parse_args(argv)
+    if options.help or not options.command:
+        return None
+    options.command = options.command.lower()
+    return options
+
+def backfill_trials():
+    """Shred every stored datastring into the trials table"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    if not table_exists(cursor, TRIALS_TABLE):
+        print(f"No {TRIALS_TABLE} table yet; start the psiTurk server once to create it.")
+        conn.close()
+        return
+    
+    placeholders = ', '.join(f':{column}' for column in TRIAL_RECORD_COLUMNS)
+    insert = (f"INSERT OR IGNORE INTO {TRIALS_TABLE} ({', '.join(TRIAL_RECORD_COLUMNS)}) "
+              f"VALUES ({placeholders})")
+    
+    participants = 0
+    inserted = 0
+    read_cursor = conn.cursor()
+    read_cursor.execute("SELECT uniqueid, datastring FROM assignments WHERE datastring IS NOT NULL")
+    for uniqueid, datastring in read_cursor:
+        try:
+            records = loads(datastring).get('data', [])
+        except ValueError as e:
+            print(f"Error processing participant {uniqueid}: {e}")
+            continue
+        # rows already written by the server keep their primary key and are skipped
+        cursor.executemany(insert, shred_records(uniqueid, records))
+        inserted += cursor.rowcount
+        participants += 1
+    if table_exists(cursor, SUMMARY_TABLE):
+        refresh_summaries(conn)
+    conn.commit()
+    conn.close()
+    
+    print(f"\n✅ Backfilled {inserted} trial record(s) from {participants} participant(s)\n")
+
+def refresh_summaries(conn, incremental=False):
+    """Rebuild participant_summary rows from trials and assignments; returns rows written
+    
+    Pure SQL, no datastring is decoded. With incremental=True only
+    participants without a summary row, or whose status, bonus or endhit
+    no longer match it, are rewritten; trial changes are kept current by
+    the server on every save.
+    """
+    stale = ""
+    if incremental:
+        stale = f"""
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {SUMMARY_TABLE} s
+            WHERE s.uniqueid = a.uniqueid
+              AND s.status IS a.status AND s.bonus IS a.bonus AND s.completed_at IS a.endhit)"""
+    cursor = conn.execute(f"""
+        INSERT OR REPLACE INTO {SUMMARY_TABLE}
+            (uniqueid, condition, n_trials, n_correct, mean_rt, bonus, status, completed_at)
+        SELECT a.uniqueid,
+               (SELECT COALESCE(c.condition, 'unknown') FROM {TRIALS_TABLE} c
+                WHERE c.uniqueid = a.uniqueid AND c.phase = 'ASSIGNMENT'
+                ORDER BY c.trial_index DESC LIMIT 1),
+               COUNT(t.trial_index),
+               COUNT(CASE WHEN t.correct = 1 THEN 1 END),
+               AVG(t.rt),
+               a.bonus, a.status, a.endhit
+        FROM assignments a
+        LEFT JOIN {TRIALS_TABLE} t
+               ON t.uniqueid = a.uniqueid AND t.phase = 'TEST' AND t.question_id IS NOT NULL{stale}
+        GROUP BY a.uniqueid
+    """)
+    return cursor.rowcount
+
+def refresh_summary_table(incremental=False):
+    """summary-refresh command"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    for table in (TRIALS_TABLE, SUMMARY_TABLE):
+        if not table_exists(cursor, table):
+            print(f"No {table} table yet; start the psiTurk server once to create it.")
+            conn.close()
+            return
+    
+    with conn:
+        refreshed = refresh_summaries(conn, incremental)
+    conn.close()
+    print(f"\n✅ Refreshed {refreshed} {SUMMARY_TABLE} row(s)\n")
+
+def index_columns(cursor, name):
+    """Columns of index `name` in order, or None if there is no such index"""
+    columns = [row[2] for row in cursor.execute(f"PRAGMA index_info({name})")]
+    return columns or None
+
+def migrate_indexes():
+    """Create any missing ASSIGNMENT_INDEXES, then check each exists on the right columns
+    
+    The server does the same on its first request; this lets a database be
+    migrated (or checked) without starting it.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    if not table_exists(cursor, ASSIGNMENTS_TABLE):
+        print(f"No {ASSIGNMENTS_TABLE} table yet; start the psiTurk server once to create it.")
+        conn.close()
+        return
+    
+    print()
+    created = 0
+    mismatched = 0
+    for name, columns in ASSIGNMENT_INDEXES:
+        if index_columns(cursor, name) is None:
+            start = time.perf_counter()
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} "
+                           f"ON {ASSIGNMENTS_TABLE} ({', '.join(columns)})")
+            print(f"   Created {name} in {time.perf_counter() - start:.2f}s")
+            created += 1
+        existing = index_columns(cursor, name)
+        if existing != columns:
+            print(f"   ❌ {name} is on ({', '.join(existing)}), expected ({', '.join(columns)})")
+            mismatched += 1
+        else:
+            print(f"   ✓ {name} ({', '.join(columns)})")
+    if created:
+        # refresh the planner's statistics for the new indexes
+        cursor.execute(f"ANALYZE {ASSIGNMENTS_TABLE}")
+    conn.commit()
+    ensure_change_log(conn)
+    triggers = cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+                              "AND tbl_name = ?", (ASSIGNMENTS_TABLE,)).fetchone()[0]
+    print(f"   ✓ {CHANGES_TABLE} change log ({triggers} trigger(s))")
+    conn.close()
+    
+    if mismatched:
+        print(f"\n{mismatched} index(es) differ from db_indexes.py; drop them and run migrate again.\n")
+    else:
+        print(f"\n✅ {len(ASSIGNMENT_INDEXES)} index(es) verified, {created} created\n")
+
+def explain_queries():
+    """(label, sql, parameters) for the queries `explain` reports on"""
+    return [
+        ('list', LIST_QUERY, ()),
+        ('participant <id>', PARTICIPANT_QUERY, ('',)),
+        ('export --incremental', INCREMENTAL_EXPORT_QUERY, (0, 0)),
+        ('stats', SUMMARY_STATS_QUERY, COMPLETED_STATUSES),
+        ('server: participant by worker and assignment',
+         "SELECT uniqueid FROM assignments WHERE workerid = ? AND assignmentid = ?", ('', '')),
+        ('completed participants',
+         f"SELECT uniqueid FROM assignments WHERE status IN ({', '.join('?' * len(COMPLETED_STATUSES))})",
+         COMPLETED_STATUSES),
+        ('participants by mode and code version',
+         "SELECT uniqueid FROM assignments WHERE mode = ? AND codeversion = ?", ('', '')),
+    ]
+
+def explain(sql=None):
+    """Print SQLite's query plan for each explain_queries() entry, or for sql
+    
+    Plans that scan a whole table or sort in a temporary b-tree are marked,
+    since those are the ones that slow down as the study grows.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    queries = [('sql', sql, (None,) * sql.count('?'))] if sql else explain_queries()
+    
+    print(f"\n{'='*80}")
+    print("QUERY PLANS")
+    print(f"{'='*80}")
+    for label, query, parameters in queries:
+        print(f"\n{label}:")
+        try:
+            plan = cursor.execute(f"EXPLAIN QUERY PLAN {query}", parameters).fetchall()
+        except sqlite3.Error as e:
+            print(f"  (not available: {e})")
+            continue
+        depth = {0: 0}
+        for step in plan:
+            depth[step['id']] = depth.get(step['parent'], 0) + 1
+            detail = step['detail']
+            slow = detail.startswith('SCAN') and 'USING' not in detail or 'TEMP B-TREE' in detail
+            print(f"{'  ' * depth[step['id']]}{detail}{'   <- full scan/sort' if slow else ''}")
+    print(f"\n{'='*80}\n")
+    conn.close()
+
 def main():
     """Main function"""
-    if len(sys.argv) < 2:
+    options = parse_args(sys.argv[1:])
+    if options is None:
         print(__doc__)
         return
     
-    command = sys.argv[1].lower()
+    command = options.command
+    
+    if options.snapshot:
+        if command not in ('list', 'query', 'stats', 'export-csv', 'export-parquet', 'export-json',
+                           'participant', 'explain'):
+            print(f"--snapshot only applies to read commands, not {command}")
+            return
+        global SNAPSHOT_PATH
+        SNAPSHOT_PATH = latest_snapshot() if options.snapshot == 'latest' else options.snapshot
+        if not SNAPSHOT_PATH or not os.path.exists(SNAPSHOT_PATH):
+            print("No snapshot found. Create one with: python query_data.py snapshot")
+            return
+        print(f"Reading from snapshot {SNAPSHOT_PATH}")
     
     if command == 'list':
         list_participants()
     
+    elif command == 'query':
+        query_participants(options)
+    
     elif command == 'export-csv':
-        export_to_csv()
+        export_to_csv(incremental=options.incremental, workers=options.workers)
+    
+    elif command == 'export-parquet':
+        export_to_parquet(incremental=options.incremental, workers=options.workers)
     
     elif command == 'export-json':
-        export_to_json()
+        export_to_json(ndjson=options.ndjson, compress=options.compress, workers=options.workers,
+                       use_cache=options.use_cache)
     
     elif command == 'participant':
-        if len(sys.argv) < 3:
+        if not options.args:
             print("Please provide participant ID")
             print("Usage: python query_data.py participant <id>")
             return
-        show_participant(sys.argv[2])
+        show_participant(options.args[0])
     
     elif command == 'stats':
-        show_stats()
+        show_stats(workers=options.workers)
+    
+    elif command == 'backfill-trials':
+        backfill_trials()
+    
+    elif command == 'summary-refresh':
+        refresh_summary_table(incremental=options.incremental)
+    
+    elif command == 'migrate':
+        migrate_indexes()
+    
+    elif command == 'explain':
+        explain(options.args[0] if options.args else None)
+    
+    elif command == 'snapshot':
+        create_snapshot()
+    
+    elif command == 'bonus-recompute':
+        recompute_bonuses(workers=options.workers)
     
     else:
         print(f"Unknown command: {command}")
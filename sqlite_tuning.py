@@ -0,0 +1,41 @@
+"""
+SQLite connection settings for participants.db.
+
+The experiment server (custom.py) switches the database to WAL once, on its
+first request, and applies CONNECTION_PRAGMAS to every new SQLAlchemy
+connection. psiTurk's engine doesn't pool SQLite connections, so that is
+every request, and only cheap per-connection settings belong there.
+query_data.get_connection() also applies ANALYSIS_PRAGMAS, which pay off
+over the long reads of one CLI run, so analysts can read the database
+during a live HIT without blocking participant saves.
+"""
+
+# stored in the database file, so setting it once covers every connection
+DATABASE_PRAGMAS = [
+    # readers and the writer no longer block each other
+    ('journal_mode', 'WAL'),
+]
+
+CONNECTION_PRAGMAS = [
+    # wait up to 5s for a lock instead of failing with "database is locked"
+    ('busy_timeout', 5000),
+    # safe with WAL; skips an fsync on every commit
+    ('synchronous', 'NORMAL'),
+]
+
+# only worth it on a long-lived connection: a per-request server connection
+# would start each request with an empty cache and a fresh mapping
+ANALYSIS_PRAGMAS = [
+    # memory-map up to 256 MiB of the database file
+    ('mmap_size', 256 * 1024 * 1024),
+    # negative means KiB: 64 MiB page cache per connection
+    ('cache_size', -64 * 1024),
+]
+
+
+def tune_sqlite_connection(dbapi_connection, pragmas=CONNECTION_PRAGMAS):
+    """Apply `pragmas` (CONNECTION_PRAGMAS by default) to a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
@@ -1,6 +1,6 @@
 /*
  * Updated task.js for Adaptive vs Static robot experiment
- * - Random assignment to Adaptive / Static via mycondition or fallback random
+ * - Adaptive (0) / Static (1) from the server's condition, or fallback random
  * - Quiz with easy/difficult questions
  * - Adaptive robot adjusts feedback based on running correctness counter
  * - Static robot gives terse feedback and always gives review link
@@ -9,9 +9,97 @@
  * Make sure psiTurk, _, d3, jQuery are available (same requirements as before)
  */
 
+/*
+ * Delta sync: replace psiTurk.saveData so each save only PUTs the trial and
+ * event records added since the last save the server acknowledged (see
+ * /sync_delta in custom.py). The first save, and any save the server rejects
+ * with 409 because it holds a different number of records, falls back to the
+ * normal full Backbone save to /sync.
+ *
+ * This lives here rather than in static/js/psiturk.js because the psiTurk
+ * server always serves its own bundled copy of psiturk.js.
+ */
+function installDeltaSync(psiTurk) {
+    var taskdata = psiTurk.taskdata;
+    var synced = null;  // {data: n, eventdata: m} records the server holds, null = unknown
+    var queue = Promise.resolve();  // saves run one at a time so offsets stay valid
+
+    function lengths() {
+        return {data: taskdata.get('data').length,
+                eventdata: taskdata.get('eventdata').length};
+    }
+
+    // done() runs even if the callback throws, so later saves aren't stalled
+    function settle(callback, context, args, done) {
+        try {
+            if (callback) callback.apply(context, args);
+        } finally {
+            done();
+        }
+    }
+
+    function fullSave(callbacks, done) {
+        // captured as the save serializes taskdata, so it counts exactly what is sent
+        var sent = lengths();
+        taskdata.save(undefined, {
+            success: function() {
+                synced = sent;
+                settle(callbacks.success, this, arguments, done);
+            },
+            error: function() {
+                synced = null;
+                settle(callbacks.error, this, arguments, done);
+            }
+        });
+    }
+
+    function deltaSave(callbacks, done) {
+        var sent = lengths();
+        var attrs = taskdata.toJSON();
+        var delta = {
+            data_offset: synced.data,
+            data: attrs.data.slice(synced.data, sent.data),
+            event_offset: synced.eventdata,
+            eventdata: attrs.eventdata.slice(synced.eventdata, sent.eventdata),
+            fields: _.omit(attrs, 'data', 'eventdata')
+        };
+        $.ajax("/sync_delta/" + taskdata.id, {
+            type: "PUT",
+            contentType: "application/json",
+            data: JSON.stringify(delta),
+            success: function() {
+                synced = sent;
+                settle(callbacks.success, this, arguments, done);
+            },
+            error: function(xhr) {
+                if (xhr.status === 409) {
+                    // server and client disagree on what was saved; resend everything
+                    fullSave(callbacks, done);
+                } else {
+                    settle(callbacks.error, this, arguments, done);
+                }
+            }
+        });
+    }
+
+    psiTurk.saveData = function(callbacks) {
+        callbacks = callbacks || {};
+        queue = queue.then(function() {
+            return new Promise(function(done) {
+                if (synced === null) {
+                    fullSave(callbacks, done);
+                } else {
+                    deltaSave(callbacks, done);
+                }
+            });
+        });
+    };
+}
+
 // Initialize psiTurk object (unchanged)
 $(window).on('load', async () => {
 var psiTurk = new PsiTurk(uniqueId, adServerLoc, mode);
+installDeltaSync(psiTurk);
 
 var mycondition = (typeof condition !== 'undefined') ? condition : null;  
 var mycounterbalance = (typeof counterbalance !== 'undefined') ? counterbalance : null; 
@@ -168,13 +256,14 @@ function resolveCondition(raw) {
         // fallback: random (only if counterbalance not available)
         return Math.random() < 0.5 ? CONDITIONS.ADAPTIVE : CONDITIONS.STATIC;
     }
+    // 0 is adaptive, as on the server's /intro and /instructions pages
     if (typeof raw === 'string') {
         raw = raw.toLowerCase();
-        if (raw === 'adaptive' || raw === 'a' || raw === '1') return CONDITIONS.ADAPTIVE;
-        if (raw === 'static' || raw === 's' || raw === '0') return CONDITIONS.STATIC;
+        if (raw === 'adaptive' || raw === 'a' || raw === '0') return CONDITIONS.ADAPTIVE;
+        if (raw === 'static' || raw === 's' || raw === '1') return CONDITIONS.STATIC;
     }
     if (typeof raw === 'number') {
-        return (raw === 1) ? CONDITIONS.ADAPTIVE : CONDITIONS.STATIC;
+        return (raw === 0) ? CONDITIONS.ADAPTIVE : CONDITIONS.STATIC;
     }
     // default random
     return Math.random() < 0.5 ? CONDITIONS.ADAPTIVE : CONDITIONS.STATIC;
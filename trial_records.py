@@ -0,0 +1,51 @@
+"""
+Shredding of datastring trial records into rows of the `trials` table.
+
+Shared by the experiment server (custom.py), which fills the table as data
+arrives, and query_data.py, which backfills participants saved before the
+table existed.
+"""
+
+TRIALS_TABLE = 'trials'
+# one row per participant, refreshed from trials on every save
+SUMMARY_TABLE = 'participant_summary'
+
+# dollars paid per correct TEST trial
+BONUS_PER_CORRECT = 0.02
+
+TRIAL_RECORD_COLUMNS = ['uniqueid', 'trial_index', 'phase', 'question_id', 'condition',
+                        'correct', 'rt', 'feedback_type', 'timestamp']
+
+
+def shred_records(uniqueid, records, start=0):
+    """Turn datastring `data` records into trials rows
+
+    `start` is the position of records[0] in the participant's full `data`
+    list; it becomes trial_index so re-shredding the same record always
+    lands on the same primary key.
+    """
+    rows = []
+    for offset, record in enumerate(records):
+        trial = record.get('trialdata') or {}
+        correct = trial.get('correct')
+        rt = trial.get('rt')
+        rows.append({
+            'uniqueid': uniqueid,
+            'trial_index': start + offset,
+            'phase': trial.get('phase'),
+            'question_id': trial.get('question_id'),
+            'condition': trial.get('condition'),
+            'correct': correct if isinstance(correct, bool) else None,
+            'rt': rt if isinstance(rt, (int, float)) and not isinstance(rt, bool) else None,
+            'feedback_type': trial.get('feedback_type'),
+            'timestamp': record.get('dateTime'),
+        })
+    return rows
+
+
+def bonus_for_records(records):
+    """Bonus earned by a datastring `data` list: BONUS_PER_CORRECT per correct TEST trial"""
+    correct = sum(1 for record in records
+                  if (record.get('trialdata') or {}).get('phase') == 'TEST'
+                  and record['trialdata'].get('correct') is True)
+    return round(correct * BONUS_PER_CORRECT, 2)